@@ -1,27 +1,53 @@
 """
 Aurite MCP Project Configuration
 """
-from aurite import Project, Server
 
-# 创建Aurite项目
-project = Project(
-    name="csv-data-analysis-agent",
-    description="AI Agent for CSV data analysis with natural language queries",
-    version="1.0.0"
-)
+class LazyProxy:
+    """Defer object construction until the first attribute access"""
 
-# 创建MCP服务器
-server = Server(
-    name="csv-analysis-server",
-    description="Server for CSV data analysis operations"
-)
+    def __init__(self, factory):
+        self._factory = factory
+        self._obj = None
 
-# 导出项目配置
-if __name__ == "__main__":
+    def _resolve(self):
+        if self._obj is None:
+            self._obj = self._factory()
+        return self._obj
+
+    def __getattr__(self, name):
+        return getattr(self._resolve(), name)
+
+def _create_project():
+    from aurite import Project
+    return Project(
+        name="csv-data-analysis-agent",
+        description="AI Agent for CSV data analysis with natural language queries",
+        version="1.0.0"
+    )
+
+def _create_server():
+    from aurite import Server
+    return Server(
+        name="csv-analysis-server",
+        description="Server for CSV data analysis operations"
+    )
+
+# 创建Aurite项目 (created on first use)
+project = LazyProxy(_create_project)
+
+# 创建MCP服务器 (created on first use)
+server = LazyProxy(_create_server)
+
+def _main():
+    """Print project metadata (resolves the lazy Project/Server)"""
     print("Aurite Project initialized")
     print(f"Project: {project.name}")
     print(f"Server: {server.name}")
 
+# 导出项目配置
+if __name__ == "__main__":
+    _main()
+
 
 
 
@@ -0,0 +1,227 @@
+"""
+Code Executor
+Runs generated Pandas code; frontend.py calls execute_code in persistent worker processes,
+so matplotlib/seaborn are imported once per worker and parsed CSVs stay cached there
+"""
+import ast
+import base64
+import importlib.util
+import io
+import json
+import os
+import time
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+# pyarrow's multi-threaded CSV reader, when installed
+_CSV_ENGINE = 'pyarrow' if importlib.util.find_spec('pyarrow') is not None else None
+
+def _read_csv(csv_filepath):
+    """Parse a whole CSV, with the pyarrow engine when it is available"""
+    if _CSV_ENGINE:
+        try:
+            return pd.read_csv(csv_filepath, engine=_CSV_ENGINE)
+        except Exception as e:
+            # Files the pyarrow reader rejects still parse with the default C engine
+            print(f"Warning: {_CSV_ENGINE} CSV engine failed ({e}), using the default parser")
+    return pd.read_csv(csv_filepath)
+
+# Opt-in, because downcasting changes results of generated code (int8 overflow, float32 precision,
+# groupby on categoricals listing unobserved categories)
+OPTIMIZE_DTYPES = os.getenv('CSV_OPTIMIZE_DTYPES', '').lower() in ('1', 'true', 'yes')
+
+def _optimize_dtypes(df):
+    """Downcast numeric columns and category-encode repetitive text columns (in place)"""
+    for i, dtype in enumerate(df.dtypes):
+        series = df.iloc[:, i]
+        if dtype.kind == 'i':
+            df.isetitem(i, pd.to_numeric(series, downcast='integer'))
+        elif dtype.kind == 'u':
+            df.isetitem(i, pd.to_numeric(series, downcast='unsigned'))
+        elif dtype.kind == 'f':
+            df.isetitem(i, pd.to_numeric(series, downcast='float'))
+        elif pd.api.types.is_string_dtype(dtype) and len(series) and series.nunique() / len(series) < 0.5:
+            df.isetitem(i, series.astype('category'))
+    return df
+
+# Charts are encoded at 80 dpi with fast zlib settings
+CHART_DPI = 80
+_CHART_PIL_KWARGS = {'compress_level': 1}
+
+def _encode_chart(fig, plt):
+    """Render a figure to a base64 PNG data URL and close it"""
+    # A buffer per call: with EXEC_WORKERS=0 several request threads encode at once
+    buf = io.BytesIO()
+    try:
+        fig.savefig(buf, format='png', bbox_inches='tight', dpi=CHART_DPI, pil_kwargs=_CHART_PIL_KWARGS)
+    finally:
+        plt.close(fig)  # Close chart to free memory
+    img_base64 = base64.b64encode(buf.getbuffer()).decode('ascii')
+    return f'data:image/png;base64,{img_base64}'
+
+@lru_cache(maxsize=8)
+def _load_df(csv_hash, csv_filepath):
+    """Parse a CSV once per content hash; later turns on the same file reuse the frame (treat it as read-only)"""
+    df = _read_csv(csv_filepath)
+    if OPTIMIZE_DTYPES:
+        df = _optimize_dtypes(df)
+    return df
+
+_plt = None
+_sns = None
+
+def _plotting():
+    """matplotlib.pyplot (Agg backend) and seaborn, imported on first use"""
+    global _plt, _sns
+    if _plt is None:
+        import matplotlib
+        matplotlib.use('Agg')  # Use non-interactive backend
+        import matplotlib.pyplot as plt
+        import seaborn as sns
+        _plt, _sns = plt, sns
+    return _plt, _sns
+
+def init_worker():
+    """Process pool initializer: pay the plotting imports before the first request"""
+    _plotting()
+
+# What generated code may import, and names/attributes it may not touch (no files, processes,
+# network or interpreter internals)
+_ALLOWED_MODULES = {'pandas', 'numpy', 'matplotlib', 'seaborn', 'json', 'math', 'statistics',
+                    'datetime', 're', 'collections', 'itertools', 'functools'}
+_BLOCKED_NAMES = {'open', 'exec', 'eval', 'compile', '__import__', 'input', 'breakpoint',
+                  'globals', 'locals', 'vars', 'getattr', 'setattr', 'delattr', 'exit', 'quit'}
+_BLOCKED_ATTRS = {'to_csv', 'to_excel', 'to_pickle', 'to_parquet', 'to_sql', 'to_hdf', 'to_feather',
+                  'to_stata', 'savefig', 'system', 'popen'}
+
+def _validate(tree):
+    """Reject generated code that imports or calls anything outside the read-only analysis toolkit"""
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            modules = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom):
+            modules = [node.module or '']
+        else:
+            modules = ()
+        for module in modules:
+            if module.split('.')[0] not in _ALLOWED_MODULES:
+                raise ValueError(f"Disallowed import: {module}")
+        if isinstance(node, ast.Name) and node.id in _BLOCKED_NAMES:
+            raise ValueError(f"Disallowed name: {node.id}")
+        if isinstance(node, ast.Attribute):
+            if node.attr.startswith('__') or node.attr in _BLOCKED_ATTRS or node.attr.startswith('read_'):
+                raise ValueError(f"Disallowed attribute: {node.attr}")
+
+@lru_cache(maxsize=256)
+def _compile(code):
+    """Validate and compile generated code once per distinct source (repeated answers reuse it)"""
+    tree = ast.parse(code, '<generated>')
+    _validate(tree)
+    return compile(tree, '<generated>', 'exec')
+
+def execute_code(code, csv_filepath, csv_hash=None):
+    """Execute generated code against the CSV and describe the result (runs inside a worker process)"""
+    execution_time = None
+    try:
+        # Read CSV file (parsed frames are cached by csv_hash; generated code gets its own copy
+        # so in-place edits such as df['new'] = ... never leak into later questions)
+        if csv_hash:
+            df = _load_df(csv_hash, csv_filepath).copy()
+        else:
+            df = _read_csv(csv_filepath)
+        
+        # Prepare execution environment
+        plt, sns = _plotting()
+        
+        exec_globals = {
+            'pd': pd,
+            'np': np,
+            'df': df,
+            'json': json,
+            'plt': plt,
+            'sns': sns,
+            'result': None,
+            'fig': None
+        }
+        
+        # Execute code
+        exec_result = {}
+        exec_locals = {}
+        
+        # Execute code and capture output with timing
+        try:
+            code_obj = _compile(code)
+            start_time = time.time()
+            exec(code_obj, exec_globals, exec_locals)
+            execution_time = time.time() - start_time
+            
+            # Check result type
+            result = None
+            
+            # Check for chart first
+            if 'fig' in exec_locals and exec_locals['fig'] is not None:
+                # Chart result
+                fig = exec_locals['fig']
+                exec_result = {
+                    'type': 'chart',
+                    'data': _encode_chart(fig, plt)
+                }
+                return exec_result
+            
+            # Check result variable
+            if 'result' in exec_locals and exec_locals['result'] is not None:
+                result = exec_locals['result']
+            else:
+                # Try to get last expression result
+                result = exec_locals.get('_', None)
+                if result is None:
+                    exec_result = {
+                        'type': 'text',
+                        'data': 'Code executed successfully, but no result returned. Please ensure the code has an explicit return value or assigns to the result variable.'
+                    }
+                    return exec_result
+            
+            # Determine result type
+            if isinstance(result, (int, float, np.number)):
+                exec_result = {
+                    'type': 'number',
+                    'data': float(result)
+                }
+            elif isinstance(result, pd.DataFrame):
+                exec_result = {
+                    'type': 'table',
+                    'data': result.to_dict('records'),
+                    'columns': result.columns.tolist()
+                }
+            elif isinstance(result, pd.Series):
+                exec_result = {
+                    'type': 'table',
+                    'data': result.to_dict(),
+                    'columns': ['Index', 'Value']
+                }
+            else:
+                exec_result = {
+                    'type': 'text',
+                    'data': str(result)
+                }
+            
+            # Add execution time to result
+            if execution_time is not None:
+                exec_result['execution_time'] = execution_time
+            
+            return exec_result
+        except Exception as e:
+            error_result = {
+                'type': 'error',
+                'data': f'Execution error: {str(e)}'
+            }
+            if execution_time is not None:
+                error_result['execution_time'] = execution_time
+            return error_result
+    except Exception as e:
+        return {
+            'type': 'error',
+            'data': f'Error: {str(e)}'
+        }
@@ -2,30 +2,140 @@
 Configuration file for environment variables
 """
 import os
-from dotenv import load_dotenv
+import re
+import sys
+import tomllib
+from functools import lru_cache
+from pathlib import Path
 
-load_dotenv()
+# .env next to this file, like config.toml (not resolved against the working directory)
+_ENV_FILE = Path(__file__).parent / '.env'
 
-# OpenAI Configuration
-OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
-OPENAI_MODEL = os.getenv('OPENAI_MODEL', 'gpt-4')
+# A KEY=VALUE line, optionally prefixed with `export` and with a double- or single-quoted value.
+# Exactly one value group matches, so match.lastindex points at it. Inline `# comments`
+# after an unquoted value are kept as part of the value.
+_ENV_LINE_RE = re.compile(r'''\s*(?:export\s+)?([A-Z_][A-Z0-9_]*)\s*=\s*(?:"([^"]*)"|'([^']*)'|(.*?))\s*''')
 
-# Smithery Configuration
-SMITHERY_API_KEY = os.getenv('SMITHERY_API_KEY')
-SMITHERY_PROFILE_ID = os.getenv('SMITHERY_PROFILE_ID')
-SMITHERY_API_URL = 'https://api.smithery.ai/v1'
+@lru_cache(maxsize=None)
+def _load_env_once(path, mtime):
+    """Parse a .env file; cached per (path, mtime) so an unchanged file is parsed once"""
+    # One unbuffered read of the whole file; splitlines drops the \r of CRLF files (setup_env.bat writes them)
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        raw = os.read(fd, os.fstat(fd).st_size).decode('utf-8')
+    finally:
+        os.close(fd)
+    return tuple((match[1], match[match.lastindex])
+                 for match in map(_ENV_LINE_RE.fullmatch, raw.splitlines()) if match)
 
-# Flask Configuration
-SECRET_KEY = os.getenv('SECRET_KEY', 'dev-secret-key-change-in-production')
-UPLOAD_FOLDER = 'uploads'
+def _load_env(path=_ENV_FILE):
+    """Load KEY=VALUE pairs from a .env file without overriding existing variables"""
+    for key, value in _load_env_once(path, os.path.getmtime(path)):
+        os.environ.setdefault(key, value)
+
+def load_env_file():
+    """
+    Load .env into os.environ for modules that read os.environ directly (existing variables win,
+    as with python-dotenv's load_dotenv). Returns False when there is no .env file.
+    """
+    if not _ENV_FILE.is_file():
+        return False
+    _load_env()
+    return True
+
+def _env_file_needed():
+    """Only parse .env outside production, when it exists and the environment
+    wasn't already populated (e.g. by the container/systemd environment)"""
+    return (os.environ.get('FLASK_ENV') != 'production'
+            and _ENV_FILE.is_file()
+            and 'OPENAI_API_KEY' not in os.environ)
+
+# Non-secret defaults live in config.toml; secrets stay in the environment
+with open(Path(__file__).parent / 'config.toml', 'rb') as f:
+    _defaults = tomllib.load(f)
+
+# (name, default) for every setting read from the environment
+_SCHEMA = (
+    # OpenAI Configuration
+    ('OPENAI_API_KEY', None),
+    ('OPENAI_MODEL', _defaults['openai']['model']),
+    # Smithery Configuration
+    ('SMITHERY_API_KEY', None),
+    ('SMITHERY_PROFILE_ID', None),
+)
+
+# Cold settings, only read from the environment on first access (see __getattr__)
+_LAZY_SCHEMA = {
+    # Flask Configuration
+    'SECRET_KEY': 'dev-secret-key-change-in-production',
+}
+
+if _env_file_needed():
+    _load_env()
+
+# Snapshot the environment once and read every setting from it
+_env = dict(os.environ)
+
+# Bound once so each lookup below is a plain name load plus a dict get
+_getenv = _env.get
+
+def _resolve_settings():
+    """Bind every _SCHEMA setting as a module global in a single pass"""
+    g = globals()
+    for name, default in _SCHEMA:
+        g[name] = _getenv(name, default)
+
+_resolve_settings()
+
+# Smithery Configuration (keys come from _SCHEMA)
+SMITHERY_API_URL = sys.intern(_defaults['smithery']['api_url'])
+
+# Flask Configuration (SECRET_KEY comes from _LAZY_SCHEMA)
+# Resolved once at import so per-request joins skip the cwd lookup
+UPLOAD_FOLDER = Path(__file__).parent.resolve() / _defaults['flask']['upload_folder']
+UPLOAD_FOLDER.mkdir(exist_ok=True)
 MAX_CONTENT_LENGTH = None  # 16 * 1024 * 1024
 # 16MB
 
-# Aurite Configuration
-AURITE_PROJECT_NAME = 'csv-data-analysis-agent'
-AURITE_SERVER_NAME = 'csv-analysis-server'
+# Aurite Configuration (interned so consumers can rely on identity comparison)
+AURITE_PROJECT_NAME = sys.intern(_defaults['aurite']['project_name'])
+AURITE_SERVER_NAME = sys.intern(_defaults['aurite']['server_name'])
 
+class _Config:
+    """Slotted snapshot of the settings above (use `settings.NAME` in hot paths)"""
+    __slots__ = ('OPENAI_API_KEY', 'OPENAI_MODEL', 'SMITHERY_API_KEY', 'SMITHERY_PROFILE_ID',
+                 'SMITHERY_API_URL', 'SECRET_KEY', 'UPLOAD_FOLDER', 'MAX_CONTENT_LENGTH',
+                 'AURITE_PROJECT_NAME', 'AURITE_SERVER_NAME')
 
+    def __init__(self, values):
+        for name in self.__slots__:
+            setattr(self, name, values[name])
 
+def _resolve_lazy(name):
+    """Read a cold setting and store it as a global so later reads skip __getattr__"""
+    value = globals()[name] = _getenv(name, _LAZY_SCHEMA[name])
+    return value
 
+def __getattr__(name):
+    """Resolve cold settings and `settings` on first module attribute access (PEP 562)"""
+    if name in _LAZY_SCHEMA:
+        return _resolve_lazy(name)
+    if name == 'settings':
+        for lazy_name in _LAZY_SCHEMA:
+            if lazy_name not in globals():
+                _resolve_lazy(lazy_name)
+        value = globals()['settings'] = _Config(globals())
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
+def refresh_env_cache():
+    """Rebuild the environment snapshot (e.g. after tests modify os.environ)"""
+    global _env, _getenv
+    if _env_file_needed():
+        _load_env()
+    _env = dict(os.environ)
+    _getenv = _env.get
+    _resolve_settings()
+    # Drop lazily resolved values so the next access re-reads them
+    for name in (*_LAZY_SCHEMA, 'settings'):
+        globals().pop(name, None)
@@ -3,57 +3,148 @@ Evaluation Metrics Calculator
 Calculates code correctness, code quality, and performance metrics
 """
 import ast
+import atexit
+import bisect
+import copy
+import csv
+import functools
+import hashlib
+import itertools
+import json
+import os
 import time
-import pandas as pd
 import re
+import threading
+import traceback
+from collections import OrderedDict
 from typing import Dict, List, Optional
 from datetime import datetime
 
+try:
+    import orjson
+except ImportError:  # optional speedup; falls back to the stdlib json module
+    orjson = None
+
+_MEMO_MAXSIZE = 4096
+
+def _arg_key(value):
+    """Hash strings to a short digest so cached keys don't keep large code strings alive"""
+    if isinstance(value, str):
+        return hashlib.blake2b(value.encode('utf-8', 'surrogatepass'), digest_size=8).digest()
+    return value
+
+def _memoize_by_hash(func=None, *, maxsize=_MEMO_MAXSIZE, copy_result=True):
+    """
+    Cache a pure metric function in a bounded OrderedDict keyed by argument digests.
+    A csv_file argument is also keyed by its mtime/size so edits invalidate the entry.
+    Callers get a deep copy because the results are dicts they may update
+    (copy_result=False shares results that are only ever read).
+    """
+    if func is None:
+        return functools.partial(_memoize_by_hash, maxsize=maxsize, copy_result=copy_result)
+    
+    cache = OrderedDict()
+    # Metrics run on several threads; eviction must not interleave with a lookup
+    lock = threading.Lock()
+    arg_names = func.__code__.co_varnames[:func.__code__.co_argcount]
+    csv_index = arg_names.index('csv_file') if 'csv_file' in arg_names else None
+    copy_out = copy.deepcopy if copy_result else (lambda value: value)
+    
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        key = tuple(map(_arg_key, args)) + tuple((k, _arg_key(v)) for k, v in sorted(kwargs.items()))
+        if csv_index is not None:
+            csv_file = kwargs.get('csv_file', args[csv_index] if len(args) > csv_index else None)
+            if csv_file:
+                try:
+                    stat = os.stat(csv_file)
+                    key += (stat.st_mtime, stat.st_size)
+                except OSError:
+                    pass
+        
+        with lock:
+            if key in cache:
+                cache.move_to_end(key)
+                return copy_out(cache[key])
+        
+        result = func(*args, **kwargs)
+        with lock:
+            cache[key] = copy_out(result)
+            if len(cache) > maxsize:
+                cache.popitem(last=False)
+        return result
+    
+    def cache_clear():
+        with lock:
+            cache.clear()
+    
+    wrapper.cache_clear = cache_clear
+    return wrapper
+
+def _read_rows(f):
+    """Yield non-blank CSV rows (pandas skips blank lines too)"""
+    return (row for row in csv.reader(f) if row)
+
 def split_dataset(csv_filepath: str, num_splits: int = 3) -> List[str]:
     """
     Split CSV dataset into multiple parts for evaluation
     Returns list of file paths for split datasets
     """
     try:
-        df = pd.read_csv(csv_filepath)
-        total_rows = len(df)
+        # First pass only counts rows; nothing is parsed into a DataFrame
+        with open(csv_filepath, 'r', newline='', encoding='utf-8') as f:
+            rows = _read_rows(f)
+            header = next(rows, None)
+            total_rows = sum(1 for _ in rows)
         
-        if total_rows < num_splits:
+        if header is None or total_rows < num_splits:
             # If dataset is too small, return original file
             return [csv_filepath]
         
         split_size = total_rows // num_splits
         splits = []
         
-        for i in range(num_splits):
-            start_idx = i * split_size
-            if i == num_splits - 1:
-                # Last split gets remaining rows
-                end_idx = total_rows
-            else:
-                end_idx = (i + 1) * split_size
-            
-            split_df = df.iloc[start_idx:end_idx].copy()
-            
-            # Save split to temporary file
-            split_filepath = csv_filepath.replace('.csv', f'_split_{i+1}.csv')
-            split_df.to_csv(split_filepath, index=False)
-            splits.append(split_filepath)
+        # Second pass streams each split straight to its file
+        with open(csv_filepath, 'r', newline='', encoding='utf-8') as f:
+            rows = _read_rows(f)
+            next(rows)
+            for i in range(num_splits):
+                if i == num_splits - 1:
+                    # Last split gets remaining rows
+                    count = total_rows - i * split_size
+                else:
+                    count = split_size
+                
+                split_filepath = csv_filepath.replace('.csv', f'_split_{i+1}.csv')
+                with open(split_filepath, 'w', newline='', encoding='utf-8') as out:
+                    writer = csv.writer(out, lineterminator='\n')
+                    writer.writerow(header)
+                    writer.writerows(itertools.islice(rows, count))
+                splits.append(split_filepath)
         
         return splits
     except Exception as e:
         print(f"Error splitting dataset: {e}")
         return [csv_filepath]
 
+@_memoize_by_hash(maxsize=64, copy_result=False)
+def _parse_code(code: str):
+    """Parse code once; returns (tree, None) or (None, error) so every metric shares the result"""
+    try:
+        return ast.parse(code), None
+    except Exception as e:
+        return None, e.with_traceback(None)
+
+@_memoize_by_hash
 def check_syntax_correctness(code: str) -> Dict:
     """Check if code is syntactically correct"""
-    try:
-        ast.parse(code)
+    _, e = _parse_code(code)
+    if e is None:
         return {
             'syntax_valid': True,
             'syntax_errors': []
         }
-    except SyntaxError as e:
+    if isinstance(e, SyntaxError):
         return {
             'syntax_valid': False,
             'syntax_errors': [{
@@ -62,12 +153,17 @@ def check_syntax_correctness(code: str) -> Dict:
                 'text': e.text
             }]
         }
-    except Exception as e:
-        return {
-            'syntax_valid': False,
-            'syntax_errors': [{'message': str(e)}]
-        }
+    return {
+        'syntax_valid': False,
+        'syntax_errors': [{'message': str(e)}]
+    }
+
+# Precompiled patterns for check_code_quality
+_IMPORT_RE = re.compile(r'^import\s+|^from\s+.*\s+import', re.MULTILINE)
+_WORD_RE = re.compile(r'\w+')
+_COMPLEXITY_KEYWORDS = frozenset(['if', 'elif', 'else', 'for', 'while', 'try', 'except', 'with'])
 
+@_memoize_by_hash
 def check_code_quality(code: str) -> Dict:
     """Evaluate code quality metrics"""
     metrics = {
@@ -78,55 +174,79 @@ def check_code_quality(code: str) -> Dict:
         'readability_score': 0
     }
     
+    # One pass over the lines for both the non-blank and the long-line counts
     lines = code.split('\n')
-    metrics['line_count'] = len([l for l in lines if l.strip()])
-    
-    # Check for imports
-    if re.search(r'^import\s+|^from\s+.*\s+import', code, re.MULTILINE):
-        metrics['has_imports'] = True
-    
-    # Check for comments
-    if re.search(r'#.*', code):
-        metrics['has_comments'] = True
-    
-    # Simple complexity score (based on control structures)
-    complexity_keywords = ['if', 'elif', 'else', 'for', 'while', 'try', 'except', 'with']
-    complexity_count = sum(1 for keyword in complexity_keywords if re.search(rf'\b{keyword}\b', code))
+    line_count = 0
+    long_lines = 0
+    for line in lines:
+        line_count += bool(line.strip())
+        long_lines += len(line) > 100
+    metrics['line_count'] = line_count
+    
+    # Text scans, not the AST: stored scores depend on these exact rules (e.g. '#' anywhere is a comment)
+    metrics['has_imports'] = 'import' in code and bool(_IMPORT_RE.search(code))
+    metrics['has_comments'] = '#' in code
+    
+    # Simple complexity score (number of distinct control-structure keywords used)
+    complexity_count = len(_COMPLEXITY_KEYWORDS.intersection(_WORD_RE.findall(code)))
     metrics['complexity_score'] = complexity_count
     
     # Readability score (0-10)
     # Based on: line length, naming conventions, structure
-    readability = 10
-    long_lines = sum(1 for line in lines if len(line) > 100)
-    if long_lines > len(lines) * 0.2:
-        readability -= 2
-    if not metrics['has_comments'] and metrics['line_count'] > 10:
-        readability -= 1
-    if metrics['complexity_score'] > 5:
-        readability -= 1
+    readability = (10
+                   - 2 * (long_lines > len(lines) * 0.2)
+                   - (not metrics['has_comments'] and line_count > 10)
+                   - (complexity_count > 5))
     metrics['readability_score'] = max(0, readability)
     
     return metrics
 
+_DANGEROUS_PATTERNS = {
+    'file_write': [r'\.to_csv\(', r'\.to_excel\(', r'open\(.*[\'"]w', r'\.write\('],
+    'file_read': [r'open\(.*[\'"]r', r'pd\.read_'],
+    'network': [r'requests\.', r'urllib\.', r'http\.'],
+    'system': [r'os\.system', r'subprocess\.', r'exec\(', r'eval\('],
+    'dangerous_imports': [r'import\s+os', r'import\s+subprocess', r'import\s+sys']
+}
+
+def _build_safety_re():
+    """
+    Fuse all dangerous patterns into one zero-width alternation so code is scanned once.
+    Group g{i} maps to _SAFETY_META[i]. Both open(...) checks can match at the same
+    position, so they share a single alternative made of optional lookaheads.
+    """
+    open_prefix = r'open\('
+    meta = []
+    alternatives = []
+    open_lookaheads = []
+    for category, patterns in _DANGEROUS_PATTERNS.items():
+        for pattern in patterns:
+            group = f'g{len(meta)}'
+            meta.append((category, pattern))
+            if pattern.startswith(open_prefix):
+                open_lookaheads.append(f'(?=(?P<{group}>{pattern[len(open_prefix):]}))?')
+            else:
+                alternatives.append(f'(?P<{group}>{pattern})')
+    alternatives.append(open_prefix + ''.join(open_lookaheads))
+    return re.compile('(?=' + '|'.join(alternatives) + ')'), meta
+
+_SAFETY_RE, _SAFETY_META = _build_safety_re()
+
+@_memoize_by_hash
 def check_code_safety(code: str) -> Dict:
     """Check code safety (dangerous operations)"""
-    dangerous_patterns = {
-        'file_write': [r'\.to_csv\(', r'\.to_excel\(', r'open\(.*[\'"]w', r'\.write\('],
-        'file_read': [r'open\(.*[\'"]r', r'pd\.read_'],
-        'network': [r'requests\.', r'urllib\.', r'http\.'],
-        'system': [r'os\.system', r'subprocess\.', r'exec\(', r'eval\('],
-        'dangerous_imports': [r'import\s+os', r'import\s+subprocess', r'import\s+sys']
-    }
+    found = set()
+    for match in _SAFETY_RE.finditer(code.lower()):
+        found.update(name for name, value in match.groupdict().items() if value is not None)
     
     safety_issues = []
-    for category, patterns in dangerous_patterns.items():
-        for pattern in patterns:
-            if re.search(pattern, code, re.IGNORECASE):
-                safety_issues.append({
-                    'category': category,
-                    'pattern': pattern,
-                    'severity': 'high' if category in ['system', 'network'] else 'medium'
-                })
+    for index in sorted(int(name[1:]) for name in found):
+        category, pattern = _SAFETY_META[index]
+        safety_issues.append({
+            'category': category,
+            'pattern': pattern,
+            'severity': 'high' if category in ['system', 'network'] else 'medium'
+        })
     
     return {
         'is_safe': len(safety_issues) == 0,
@@ -134,6 +254,28 @@ def check_code_safety(code: str) -> Dict:
         'safety_score': 1.0 if len(safety_issues) == 0 else max(0, 1.0 - len(safety_issues) * 0.2)
     }
 
+# Loop constructs counted by analyze_time_complexity: (pattern, weight)
+_LOOP_RES = [
+    (re.compile(r'\bfor\s+\w+\s+in\s+'), 1),  # for loops
+    (re.compile(r'\bwhile\s+'), 1),  # while loops
+    (re.compile(r'\.apply\('), 1),  # pandas apply
+    (re.compile(r'\.iterrows\('), 1),  # pandas iterrows
+    (re.compile(r'\.itertuples\('), 1),  # pandas itertuples
+]
+
+# Pandas operations that affect time complexity (ordered best to worst)
+_TIME_COMPLEXITY_RES = {
+    complexity: [re.compile(p) for p in patterns]
+    for complexity, patterns in {
+        'O(1)': [r'\.head\(', r'\.tail\(', r'\.iloc\[', r'\.loc\[', r'\.shape', r'\.dtypes'],
+        'O(n)': [r'\.mean\(', r'\.sum\(', r'\.count\(', r'\.unique\(', r'\.value_counts\(',
+                 r'\.groupby\(', r'\.sort_values\(', r'\.dropna\(', r'\.fillna\('],
+        'O(n log n)': [r'\.sort_values\(', r'\.sort_index\('],
+        'O(n²)': [r'\.merge\(', r'\.join\(', r'\.concat\(.*axis=1']
+    }.items()
+}
+
+@_memoize_by_hash
 def analyze_time_complexity(code: str) -> Dict:
     """
     Analyze time complexity of the code
@@ -141,38 +283,21 @@ def analyze_time_complexity(code: str) -> Dict:
     """
     complexity_score = 0
     complexity_notation = "O(1)"
+    code_lower = code.lower()
     
-    # Count loops and nested structures
-    loop_patterns = [
-        (r'\bfor\s+\w+\s+in\s+', 1),  # for loops
-        (r'\bwhile\s+', 1),  # while loops
-        (r'\.apply\(', 1),  # pandas apply
-        (r'\.iterrows\(', 1),  # pandas iterrows
-        (r'\.itertuples\(', 1),  # pandas itertuples
-    ]
-    
+    # Count loops and nested structures (text patterns, so stored scores stay comparable)
     nested_loops = 0
-    for pattern, weight in loop_patterns:
-        matches = len(re.findall(pattern, code, re.IGNORECASE))
+    for pattern, weight in _LOOP_RES:
+        matches = len(pattern.findall(code_lower))
         nested_loops += matches * weight
     
-    # Check for pandas operations that affect complexity
-    pandas_ops = {
-        'O(1)': [r'\.head\(', r'\.tail\(', r'\.iloc\[', r'\.loc\[', r'\.shape', r'\.dtypes'],
-        'O(n)': [r'\.mean\(', r'\.sum\(', r'\.count\(', r'\.unique\(', r'\.value_counts\(', 
-                 r'\.groupby\(', r'\.sort_values\(', r'\.dropna\(', r'\.fillna\('],
-        'O(n log n)': [r'\.sort_values\(', r'\.sort_index\('],
-        'O(n²)': [r'\.merge\(', r'\.join\(', r'\.concat\(.*axis=1']
-    }
-    
     max_complexity = "O(1)"
-    complexity_order = ["O(1)", "O(n)", "O(n log n)", "O(n²)", "O(n³)"]
     
-    for complexity, patterns in pandas_ops.items():
-        for pattern in patterns:
-            if re.search(pattern, code, re.IGNORECASE):
-                if complexity_order.index(complexity) > complexity_order.index(max_complexity):
-                    max_complexity = complexity
+    # Tiers are listed best to worst, so the first match scanning backwards is the max
+    for complexity, patterns in reversed(_TIME_COMPLEXITY_RES.items()):
+        if any(pattern.search(code_lower) for pattern in patterns):
+            max_complexity = complexity
+            break
     
     # Adjust based on nested loops
     if nested_loops > 0:
@@ -209,6 +334,23 @@ def analyze_time_complexity(code: str) -> Dict:
         'estimated_operations': nested_loops + 1
     }
 
+# Operations that create new data structures (ordered best to worst)
+_SPACE_COMPLEXITY_RES = {
+    complexity: [re.compile(p) for p in patterns]
+    for complexity, patterns in {
+        'O(1)': [r'\.head\(', r'\.tail\(', r'\.iloc\[', r'\.loc\[', r'\.shape', r'\.dtypes'],
+        'O(n)': [r'\.copy\(', r'\.drop\(', r'\.dropna\(', r'\.fillna\(', r'\.assign\(',
+                 r'result\s*=', r'df_new\s*=', r'df_filtered\s*='],
+        'O(n²)': [r'\.merge\(', r'\.join\(', r'\.concat\(', r'\.pivot\(', r'\.pivot_table\(']
+    }.items()
+}
+
+@functools.lru_cache(maxsize=256)
+def _csv_size_mb(path: str, mtime: float) -> float:
+    """CSV file size in MB; cached per (path, mtime)"""
+    return os.path.getsize(path) / (1024 * 1024)
+
+@_memoize_by_hash
 def analyze_space_complexity(code: str, csv_file: str = None) -> Dict:
     """
     Analyze space complexity of the code
@@ -217,30 +359,21 @@ def analyze_space_complexity(code: str, csv_file: str = None) -> Dict:
     space_complexity = "O(1)"
     estimated_memory_mb = 0
     
-    # Check for operations that create new data structures
-    space_indicators = {
-        'O(1)': [r'\.head\(', r'\.tail\(', r'\.iloc\[', r'\.loc\[', r'\.shape', r'\.dtypes'],
-        'O(n)': [r'\.copy\(', r'\.drop\(', r'\.dropna\(', r'\.fillna\(', r'\.assign\(',
-                 r'result\s*=', r'df_new\s*=', r'df_filtered\s*='],
-        'O(n²)': [r'\.merge\(', r'\.join\(', r'\.concat\(', r'\.pivot\(', r'\.pivot_table\(']
-    }
-    
-    complexity_order = ["O(1)", "O(n)", "O(n²)"]
     max_complexity = "O(1)"
+    code_lower = code.lower()
     
-    for complexity, patterns in space_indicators.items():
-        for pattern in patterns:
-            if re.search(pattern, code, re.IGNORECASE):
-                if complexity_order.index(complexity) > complexity_order.index(max_complexity):
-                    max_complexity = complexity
+    # Tiers are listed best to worst, so the first match scanning backwards is the max
+    for complexity, patterns in reversed(_SPACE_COMPLEXITY_RES.items()):
+        if any(pattern.search(code_lower) for pattern in patterns):
+            max_complexity = complexity
+            break
     
     space_complexity = max_complexity
     
     # Try to estimate memory if CSV file is available
     if csv_file:
         try:
-            import os
-            file_size = os.path.getsize(csv_file) / (1024 * 1024)  # MB
+            file_size = _csv_size_mb(csv_file, os.path.getmtime(csv_file))
             # Rough estimate: space complexity affects memory multiplier
             multipliers = {"O(1)": 1.0, "O(n)": 2.0, "O(n²)": 4.0}
             estimated_memory_mb = file_size * multipliers.get(space_complexity, 2.0)
@@ -261,6 +394,129 @@ def analyze_space_complexity(code: str, csv_file: str = None) -> Dict:
         'estimated_memory_mb': estimated_memory_mb
     }
 
+# Column access patterns used by analyze_prompt_understanding
+# df['col'] and df[['col1', 'col2']] in one pattern; group 1 holds the quoted names
+_COLUMN_RE = re.compile(r"df\[\[?((?:\s*['\"][^'\"]+['\"]\s*,?)+)")
+_QUOTED_RE = re.compile(r"['\"]([^'\"]+)['\"]")
+
+# Lowercase pandas method names that are never treated as column names
+_PANDAS_METHODS = frozenset({
+    'head', 'tail', 'mean', 'sum', 'max', 'min', 'count', 'size',
+    'shape', 'dtypes', 'columns', 'index', 'values', 'copy', 'drop',
+    'fillna', 'dropna', 'groupby', 'sort_values', 'sort_index',
+    'nlargest', 'nsmallest', 'query', 'loc', 'iloc', 'apply', 'agg',
+    'merge', 'join', 'concat', 'pivot', 'pivot_table', 'describe',
+    'info', 'isnull', 'notnull', 'unique', 'value_counts', 'sample'
+})
+
+# Common NL patterns and their code equivalents
+_NL_PATTERNS = {
+    'top_n': {
+        'question_patterns': [r'top\s+(\d+)', r'largest\s+(\d+)', r'biggest\s+(\d+)', r'highest\s+(\d+)'],
+        'code_patterns': [r'\.nlargest\(', r'\.head\(', r'\.sort_values\(.*ascending\s*=\s*false'],
+        'weight': 0.06
+    },
+    'first_n_rows': {
+        'question_patterns': [r'first\s+(\d+)\s+rows?', r'first\s+(\d+)', r'extract.*first\s+(\d+)'],
+        'code_patterns': [r'\.head\(', r'\.iloc\[.*:\s*\d+', r'\.loc\[.*:\s*\d+'],
+        'weight': 0.06
+    },
+    'bottom_n': {
+        'question_patterns': [r'bottom\s+(\d+)', r'smallest\s+(\d+)', r'lowest\s+(\d+)'],
+        'code_patterns': [r'\.nsmallest\(', r'\.tail\(', r'\.sort_values\(.*ascending\s*=\s*true'],
+        'weight': 0.06
+    },
+    'filtering': {
+        'question_patterns': [r'where', r'filter', r'only', r'greater than', r'less than', r'equal to'],
+        'code_patterns': [r'df\[.*\]', r'\.query\(', r'\.loc\[', r'\.iloc\['],
+        'weight': 0.06
+    },
+    'visualization': {
+        'question_patterns': [r'chart', r'graph', r'plot', r'visualize', r'bar chart', r'histogram', r'pie chart'],
+        'code_patterns': [r'plt\.', r'matplotlib', r'seaborn', r'sns\.', r'\.plot\(', r'fig\s*=', r'ax\.'],
+        'weight': 0.06
+    }
+}
+
+# Statistical operations and their code equivalents
+_STAT_PATTERNS = {
+    'mean': {
+        'question': [r'average', r'mean', r'avg'],
+        'code': [r'\.mean\(', r'\.average\('],
+        'weight': 0.1
+    },
+    'sum': {
+        'question': [r'sum', r'total', r'add'],
+        'code': [r'\.sum\(', r'\.agg\(.*sum'],
+        'weight': 0.1
+    },
+    'max': {
+        'question': [r'maximum', r'max', r'highest', r'largest'],
+        'code': [r'\.max\(', r'\.agg\(.*max', r'\.nlargest\('],
+        'weight': 0.1
+    },
+    'min': {
+        'question': [r'minimum', r'min', r'lowest', r'smallest'],
+        'code': [r'\.min\(', r'\.agg\(.*min', r'\.nsmallest\('],
+        'weight': 0.1
+    },
+    'count': {
+        'question': [r'count', r'number of', r'how many'],
+        'code': [r'\.count\(', r'\.size\(', r'len\(', r'\.shape\[0\]'],
+        'weight': 0.1
+    },
+    'groupby': {
+        'question': [r'group by', r'by', r'per', r'for each'],
+        'code': [r'\.groupby\(', r'\.pivot_table\('],
+        'weight': 0.1
+    }
+}
+
+_ESCAPED_PUNCT_RE = re.compile(r'\\([^\w\s])')
+_REGEX_META_RE = re.compile(r'[.^$*+?()[\]{}|\\]')
+
+def _as_literal(pattern: str) -> Optional[str]:
+    """Return the plain text a pattern matches if it has no regex operators, else None"""
+    if _REGEX_META_RE.search(_ESCAPED_PUNCT_RE.sub('', pattern)):
+        return None
+    return _ESCAPED_PUNCT_RE.sub(r'\1', pattern)
+
+def _compile_any(patterns: List[str]):
+    """
+    Build a predicate that is true when any pattern matches.
+    Literal patterns become substring tests; the rest are fused into one alternation.
+    """
+    literals = tuple(lit for lit in map(_as_literal, patterns) if lit is not None)
+    regexes = [p for p in patterns if _as_literal(p) is None]
+    fused = re.compile('|'.join(f'(?:{p})' for p in regexes)) if regexes else None
+    
+    def match(text: str) -> bool:
+        if any(lit in text for lit in literals):
+            return True
+        return fused is not None and fused.search(text) is not None
+    return match
+
+# Both sides are matched against lowercased text
+for _info in _NL_PATTERNS.values():
+    _info['question_match'] = _compile_any(_info['question_patterns'])
+    _info['code_match'] = _compile_any(_info['code_patterns'])
+for _info in _STAT_PATTERNS.values():
+    _info['question_match'] = _compile_any(_info['question'])
+    _info['code_match'] = _compile_any(_info['code'])
+
+@functools.lru_cache(maxsize=256)
+def _get_columns_lower(path: str, mtime: float, size: int) -> List[str]:
+    """Read only the CSV header line; cached per (path, mtime, size)"""
+    with open(path, 'rb') as f:
+        line = f.readline()
+    if b'"' not in line:
+        # Unquoted header (the common case): a plain split, no csv parser needed
+        return [col.lower() for col in line.decode('utf-8-sig').rstrip('\r\n').split(',')] if line else []
+    # Quoted fields may contain commas or newlines, so let csv handle them
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        return [col.lower() for col in next(csv.reader(f))]
+
+@_memoize_by_hash
 def analyze_prompt_understanding(question: str, generated_code: str, csv_file: str = None) -> Dict:
     """
     Analyze Natural-Language Intent Accuracy
@@ -284,8 +540,8 @@ def analyze_prompt_understanding(question: str, generated_code: str, csv_file: s
     available_columns = []
     if csv_file:
         try:
-            df = pd.read_csv(csv_file, nrows=0)  # Read only headers
-            available_columns = [col.lower() for col in df.columns.tolist()]
+            stat = os.stat(csv_file)
+            available_columns = list(_get_columns_lower(csv_file, stat.st_mtime, stat.st_size))
             print(f"[PROMPT_UNDERSTANDING] Loaded {len(available_columns)} columns from CSV: {available_columns[:5]}...")
         except Exception as e:
             print(f"[PROMPT_UNDERSTANDING] Error loading CSV columns: {e}")
@@ -296,6 +552,7 @@ def analyze_prompt_understanding(question: str, generated_code: str, csv_file: s
     # 1. Column extraction analysis
     # Extract column names mentioned in question (case-insensitive)
     question_lower = question.lower()
+    code_lower = generated_code.lower()
     mentioned_in_question = []
     if available_columns:
         for col in available_columns:
@@ -304,35 +561,13 @@ def analyze_prompt_understanding(question: str, generated_code: str, csv_file: s
         details['mentioned_columns'] = mentioned_in_question
     
     # Extract column names used in code
-    # Pattern: df['column'], df["column"], df[['col1', 'col2']]
-    # Exclude pandas methods (head, tail, mean, sum, etc.)
-    pandas_methods = {'head', 'tail', 'mean', 'sum', 'max', 'min', 'count', 'size', 
-                      'shape', 'dtypes', 'columns', 'index', 'values', 'copy', 'drop',
-                      'fillna', 'dropna', 'groupby', 'sort_values', 'sort_index',
-                      'nlargest', 'nsmallest', 'query', 'loc', 'iloc', 'apply', 'agg',
-                      'merge', 'join', 'concat', 'pivot', 'pivot_table', 'describe',
-                      'info', 'isnull', 'notnull', 'unique', 'value_counts', 'sample'}
-    
-    column_patterns = [
-        r"df\[['\"]([^'\"]+)['\"]\]",  # df['column'] - single column access
-        r"df\[\[['\"]([^'\"]+)['\"]",  # df[['column']] - list access start
-    ]
+    # Pattern: df['column'], df["column"], df[['col1', 'col2']], also on names like filtered_df
+    # Exclude pandas methods (see _PANDAS_METHODS)
     extracted_columns = set()
-    for pattern in column_patterns:
-        matches = re.findall(pattern, generated_code, re.IGNORECASE)
-        for match in matches:
-            if isinstance(match, str) and match.lower() not in pandas_methods:
-                extracted_columns.add(match.lower())
-    
-    # Also handle df[['col1', 'col2']] pattern more carefully
-    list_pattern = r"df\[\[([^\]]+)\]\]"
-    list_matches = re.findall(list_pattern, generated_code, re.IGNORECASE)
-    for match in list_matches:
-        # Extract individual column names from list
-        cols = re.findall(r"['\"]([^'\"]+)['\"]", match)
-        for col in cols:
-            if col.lower() not in pandas_methods:
-                extracted_columns.add(col.lower())
+    for match in _COLUMN_RE.findall(code_lower):
+        for col in _QUOTED_RE.findall(match):
+            if col not in _PANDAS_METHODS:
+                extracted_columns.add(col)
     
     details['extracted_columns'] = list(extracted_columns)
     print(f"[PROMPT_UNDERSTANDING] Extracted columns from code: {details['extracted_columns']}")
@@ -361,42 +596,14 @@ def analyze_prompt_understanding(question: str, generated_code: str, csv_file: s
     
     # 2. Natural language parsing analysis (0-0.3)
     # Check for common NL patterns and their code equivalents
-    nl_patterns = {
-        'top_n': {
-            'question_patterns': [r'top\s+(\d+)', r'largest\s+(\d+)', r'biggest\s+(\d+)', r'highest\s+(\d+)'],
-            'code_patterns': [r'\.nlargest\(', r'\.head\(', r'\.sort_values\(.*ascending\s*=\s*False'],
-            'weight': 0.06
-        },
-        'first_n_rows': {
-            'question_patterns': [r'first\s+(\d+)\s+rows?', r'first\s+(\d+)', r'extract.*first\s+(\d+)'],
-            'code_patterns': [r'\.head\(', r'\.iloc\[.*:\s*\d+', r'\.loc\[.*:\s*\d+'],
-            'weight': 0.06
-        },
-        'bottom_n': {
-            'question_patterns': [r'bottom\s+(\d+)', r'smallest\s+(\d+)', r'lowest\s+(\d+)'],
-            'code_patterns': [r'\.nsmallest\(', r'\.tail\(', r'\.sort_values\(.*ascending\s*=\s*True'],
-            'weight': 0.06
-        },
-        'filtering': {
-            'question_patterns': [r'where', r'filter', r'only', r'greater than', r'less than', r'equal to'],
-            'code_patterns': [r'df\[.*\]', r'\.query\(', r'\.loc\[', r'\.iloc\['],
-            'weight': 0.06
-        },
-        'visualization': {
-            'question_patterns': [r'chart', r'graph', r'plot', r'visualize', r'bar chart', r'histogram', r'pie chart'],
-            'code_patterns': [r'plt\.', r'matplotlib', r'seaborn', r'sns\.', r'\.plot\(', r'fig\s*=', r'ax\.'],
-            'weight': 0.06
-        }
-    }
-    
     nl_score = 0.0
-    for pattern_name, pattern_info in nl_patterns.items():
-        question_matches = any(re.search(p, question_lower) for p in pattern_info['question_patterns'])
-        code_matches = any(re.search(p, generated_code, re.IGNORECASE) for p in pattern_info['code_patterns'])
-        
-        if question_matches and code_matches:
+    for pattern_name, pattern_info in _NL_PATTERNS.items():
+        # The code only matters once the question mentions the pattern
+        if not pattern_info['question_match'](question_lower):
+            continue
+        if pattern_info['code_match'](code_lower):
             nl_score += pattern_info['weight']
-        elif question_matches and not code_matches:
+        else:
             # Pattern mentioned but not implemented
             nl_score += pattern_info['weight'] * 0.3
     
@@ -407,48 +614,12 @@ def analyze_prompt_understanding(question: str, generated_code: str, csv_file: s
     
     # 3. Statistical understanding analysis (0-0.3)
     # Check if statistical operations match the question
-    stat_patterns = {
-        'mean': {
-            'question': [r'average', r'mean', r'avg'],
-            'code': [r'\.mean\(', r'\.average\('],
-            'weight': 0.1
-        },
-        'sum': {
-            'question': [r'sum', r'total', r'add'],
-            'code': [r'\.sum\(', r'\.agg\(.*sum'],
-            'weight': 0.1
-        },
-        'max': {
-            'question': [r'maximum', r'max', r'highest', r'largest'],
-            'code': [r'\.max\(', r'\.agg\(.*max', r'\.nlargest\('],
-            'weight': 0.1
-        },
-        'min': {
-            'question': [r'minimum', r'min', r'lowest', r'smallest'],
-            'code': [r'\.min\(', r'\.agg\(.*min', r'\.nsmallest\('],
-            'weight': 0.1
-        },
-        'count': {
-            'question': [r'count', r'number of', r'how many'],
-            'code': [r'\.count\(', r'\.size\(', r'len\(', r'\.shape\[0\]'],
-            'weight': 0.1
-        },
-        'groupby': {
-            'question': [r'group by', r'by', r'per', r'for each'],
-            'code': [r'\.groupby\(', r'\.pivot_table\('],
-            'weight': 0.1
-        }
-    }
-    
     stat_score = 0.0
     detected_stats = []
-    for stat_name, stat_info in stat_patterns.items():
-        question_matches = any(re.search(p, question_lower) for p in stat_info['question'])
-        code_matches = any(re.search(p, generated_code, re.IGNORECASE) for p in stat_info['code'])
-        
-        if question_matches:
+    for stat_name, stat_info in _STAT_PATTERNS.items():
+        if stat_info['question_match'](question_lower):
             detected_stats.append(stat_name)
-            if code_matches:
+            if stat_info['code_match'](code_lower):
                 stat_score += stat_info['weight']
             else:
                 # Mentioned but not implemented
@@ -469,6 +640,18 @@ def analyze_prompt_understanding(question: str, generated_code: str, csv_file: s
         'details': details
     }
 
+# Patterns used by analyze_requirement_coverage
+_FILTER_OPS_RE = re.compile(r'df\[.*\]|\.query\(|\.loc\[.*\]|\.iloc\[.*\]')
+_GROUPBY_QUESTION_RES = [
+    re.compile(r'group\s+by\s+([^,]+(?:,\s*[^,]+)+)'),  # "group by A, B, C"
+    re.compile(r'by\s+([^,]+(?:,\s*[^,]+)+)'),  # "by A, B, C"
+]
+_GROUPBY_CODE_RE = re.compile(r'\.groupby\(\[?([^\]]+)\]?\)')
+_GROUPBY_CALL_RE = re.compile(r'\.groupby\(')
+_SORT_RE = re.compile(r'\.sort_values\(|\.sort_index\(|\.nlargest\(|\.nsmallest\(')
+_JOIN_RE = re.compile(r'\.merge\(|\.join\(|\.concat\(')
+
+@_memoize_by_hash
 def analyze_requirement_coverage(question: str, generated_code: str) -> Dict:
     """
     Analyze Requirement Coverage
@@ -489,6 +672,7 @@ def analyze_requirement_coverage(question: str, generated_code: str) -> Dict:
     }
     
     question_lower = question.lower()
+    code_lower = generated_code.lower()
     
     # 1. Filter conditions coverage
     # Count filter keywords in question
@@ -497,7 +681,7 @@ def analyze_requirement_coverage(question: str, generated_code: str) -> Dict:
     filter_count = sum(1 for keyword in filter_keywords if keyword in question_lower)
     
     # Count filter operations in code
-    filter_ops = len(re.findall(r'df\[.*\]|\.query\(|\.loc\[.*\]|\.iloc\[.*\]', generated_code))
+    filter_ops = len(_FILTER_OPS_RE.findall(generated_code))
     
     if filter_count > 1:  # Multiple conditions mentioned
         if filter_ops >= filter_count:
@@ -512,21 +696,16 @@ def analyze_requirement_coverage(question: str, generated_code: str) -> Dict:
     
     # 2. Groupby columns coverage
     # Check for "group by X, Y, Z" patterns
-    groupby_patterns = [
-        r'group\s+by\s+([^,]+(?:,\s*[^,]+)+)',  # "group by A, B, C"
-        r'by\s+([^,]+(?:,\s*[^,]+)+)',  # "by A, B, C"
-    ]
-    
     groupby_columns_mentioned = []
-    for pattern in groupby_patterns:
-        matches = re.findall(pattern, question_lower)
+    for pattern in _GROUPBY_QUESTION_RES:
+        matches = pattern.findall(question_lower)
         for match in matches:
             columns = [col.strip() for col in match.split(',')]
             groupby_columns_mentioned.extend(columns)
     
     if groupby_columns_mentioned:
         # Count groupby columns in code
-        groupby_match = re.search(r'\.groupby\(\[?([^\]]+)\]?\)', generated_code, re.IGNORECASE)
+        groupby_match = _GROUPBY_CODE_RE.search(code_lower)
         if groupby_match:
             groupby_cols_in_code = [col.strip().strip("'\"") for col in groupby_match.group(1).split(',')]
             matched = sum(1 for col in groupby_columns_mentioned if any(col.lower() in gc.lower() for gc in groupby_cols_in_code))
@@ -539,7 +718,7 @@ def analyze_requirement_coverage(question: str, generated_code: str) -> Dict:
         score += details['groupby_columns_coverage'] * 0.3
     else:
         # Check if groupby is used when not needed (false positive)
-        if re.search(r'\.groupby\(', generated_code, re.IGNORECASE):
+        if _GROUPBY_CALL_RE.search(code_lower):
             score += 0.3  # Groupby present
         else:
             score += 0.3  # No groupby needed
@@ -550,7 +729,7 @@ def analyze_requirement_coverage(question: str, generated_code: str) -> Dict:
     sort_mentioned = any(keyword in question_lower for keyword in sort_keywords)
     
     if sort_mentioned:
-        sort_in_code = bool(re.search(r'\.sort_values\(|\.sort_index\(|\.nlargest\(|\.nsmallest\(', generated_code, re.IGNORECASE))
+        sort_in_code = bool(_SORT_RE.search(code_lower))
         details['sorting_coverage'] = 1.0 if sort_in_code else 0.0
         if not sort_in_code:
             details['missing_requirements'].append('Sorting operation missing')
@@ -564,7 +743,7 @@ def analyze_requirement_coverage(question: str, generated_code: str) -> Dict:
     join_mentioned = any(keyword in question_lower for keyword in join_keywords)
     
     if join_mentioned:
-        join_in_code = bool(re.search(r'\.merge\(|\.join\(|\.concat\(', generated_code, re.IGNORECASE))
+        join_in_code = bool(_JOIN_RE.search(code_lower))
         details['join_conditions_coverage'] = 1.0 if join_in_code else 0.0
         if not join_in_code:
             details['missing_requirements'].append('Join/merge operation missing')
@@ -623,6 +802,7 @@ def analyze_error_recovery(execution_result: Dict, recovery_attempts: List[Dict]
         # Analyze error fix quality
         # Check if errors were properly addressed
         fix_quality_scores = []
+        original_error_type = _classify_error(error_message)
         for attempt in recovery_attempts:
             attempt_code = attempt.get('code', '')
             attempt_error = attempt.get('error', '')
@@ -633,7 +813,6 @@ def analyze_error_recovery(execution_result: Dict, recovery_attempts: List[Dict]
                 fix_quality_scores.append(1.0)
             else:
                 # Check if error type changed (indicates progress)
-                original_error_type = _classify_error(error_message)
                 new_error_type = _classify_error(attempt_error)
                 
                 if original_error_type != new_error_type:
@@ -670,27 +849,34 @@ def analyze_error_recovery(execution_result: Dict, recovery_attempts: List[Dict]
     
     return recovery_metrics
 
+# (error type, keywords) checked in order; the first hit wins
+_ERROR_TYPES = (
+    ('column_error', ('keyerror', 'column')),
+    ('syntax_error', ('syntax', 'invalid')),
+    ('type_error', ('type', 'dtype')),
+    ('index_error', ('index', 'out of range')),
+    ('attribute_error', ('attribute', 'has no attribute')),
+    ('value_error', ('value',)),
+)
+
+@functools.lru_cache(maxsize=1024)
 def _classify_error(error_message: str) -> str:
     """Classify error type for comparison"""
     if not error_message:
         return 'unknown'
     
     error_lower = error_message.lower()
-    
-    if 'keyerror' in error_lower or 'column' in error_lower:
-        return 'column_error'
-    elif 'syntax' in error_lower or 'invalid' in error_lower:
-        return 'syntax_error'
-    elif 'type' in error_lower or 'dtype' in error_lower:
-        return 'type_error'
-    elif 'index' in error_lower or 'out of range' in error_lower:
-        return 'index_error'
-    elif 'attribute' in error_lower or 'has no attribute' in error_lower:
-        return 'attribute_error'
-    elif 'value' in error_lower:
-        return 'value_error'
-    else:
-        return 'other_error'
+    for error_type, keywords in _ERROR_TYPES:
+        if any(keyword in error_lower for keyword in keywords):
+            return error_type
+    return 'other_error'
+
+# Performance score staircases: value < thresholds[i] scores scores[i], anything larger scores the last entry
+_EXEC_TIME_THRESHOLDS = (0.1, 1.0, 5.0)
+_EXEC_TIME_SCORES = (0.3, 0.25, 0.15, 0.05)
+_LENGTH_THRESHOLDS = (500, 1000)
+_LENGTH_PROXY_SCORES = (0.2, 0.15, 0.1)  # used when there is no execution time
+_LENGTH_SCORES = (0.1, 0.05, 0.0)
 
 def calculate_evaluation_metrics(question: str, generated_code: str, 
                                  execution_result: Dict, csv_file: str, 
@@ -769,24 +955,15 @@ def calculate_evaluation_metrics(question: str, generated_code: str,
     # Based on code efficiency indicators
     # Execution time: 30%, Time complexity: 30%, Space complexity: 20%, Code length: 10%, Execution success: 10%
     
+    # One code-length bucket feeds both length-based tables below
+    length_bucket = bisect.bisect_right(_LENGTH_THRESHOLDS, performance_metrics['code_length'])
+    
     # Execution time score (lower is better)
     if execution_time is not None:
-        if execution_time < 0.1:
-            performance_metrics['performance_score'] += 0.3
-        elif execution_time < 1.0:
-            performance_metrics['performance_score'] += 0.25
-        elif execution_time < 5.0:
-            performance_metrics['performance_score'] += 0.15
-        else:
-            performance_metrics['performance_score'] += 0.05
+        performance_metrics['performance_score'] += _EXEC_TIME_SCORES[bisect.bisect_right(_EXEC_TIME_THRESHOLDS, execution_time)]
     else:
         # If no execution time, use code length as proxy
-        if performance_metrics['code_length'] < 500:
-            performance_metrics['performance_score'] += 0.2
-        elif performance_metrics['code_length'] < 1000:
-            performance_metrics['performance_score'] += 0.15
-        else:
-            performance_metrics['performance_score'] += 0.1
+        performance_metrics['performance_score'] += _LENGTH_PROXY_SCORES[length_bucket]
     
     # Time complexity score
     performance_metrics['performance_score'] += time_complexity['score'] * 0.3
@@ -795,10 +972,7 @@ def calculate_evaluation_metrics(question: str, generated_code: str,
     performance_metrics['performance_score'] += space_complexity['score'] * 0.2
     
     # Code length score
-    if performance_metrics['code_length'] < 500:
-        performance_metrics['performance_score'] += 0.1
-    elif performance_metrics['code_length'] < 1000:
-        performance_metrics['performance_score'] += 0.05
+    performance_metrics['performance_score'] += _LENGTH_SCORES[length_bucket]
     
     # Execution success
     if execution_success:
@@ -832,116 +1006,499 @@ def calculate_evaluation_metrics(question: str, generated_code: str,
     
     return metrics
 
-def save_evaluation_metrics(session_id: str, metrics: Dict, session_dir: str = None):
+# Column layout of calculate_evaluation_metrics_batch results (one row per sample):
+# per-sample inputs first, then the scores _finalize_scores derives from them
+_BATCH_DTYPE = [
+    ('syntax_valid', '?'),
+    ('execution_success', '?'),
+    ('has_structure', '?'),
+    ('readability_score', 'f8'),
+    ('safety_score', 'f8'),
+    ('code_length', 'i8'),
+    ('execution_time', 'f8'),
+    ('time_complexity_score', 'f8'),
+    ('space_complexity_score', 'f8'),
+    ('understanding_score', 'f8'),
+    ('coverage_score', 'f8'),
+    ('recovery_score', 'f8'),
+    ('correctness_score', 'f8'),
+    ('quality_score', 'f8'),
+    ('performance_score', 'f8'),
+    ('overall_score', 'f8'),
+]
+
+# Overall score components and weights
+# Correctness 25%, Quality 20%, Performance 15%, Understanding 15%, Coverage 15%, Recovery 10%
+_OVERALL_COLUMNS = ('correctness_score', 'quality_score', 'performance_score',
+                    'understanding_score', 'coverage_score', 'recovery_score')
+_OVERALL_WEIGHTS = (0.25, 0.20, 0.15, 0.15, 0.15, 0.10)
+
+def batch_compute_overall_score(component_scores):
     """
-    Save evaluation metrics to session directory
-    Each session's metrics are stored in chat_history/{session_id}/metrics.json
+    Overall scores for an (N, 6) array of component scores in _OVERALL_COLUMNS order
+    Columns are added left to right so results match calculate_evaluation_metrics exactly
     """
-    import os
-    import json
+    import numpy as np
     
-    # Determine session directory
-    if session_dir is None:
-        session_dir = os.path.join('chat_history', session_id)
+    component_scores = np.asarray(component_scores, dtype=np.float64)
+    overall = component_scores[:, 0] * _OVERALL_WEIGHTS[0]
+    for i in range(1, len(_OVERALL_WEIGHTS)):
+        overall = overall + component_scores[:, i] * _OVERALL_WEIGHTS[i]
+    return overall
+
+def _finalize_scores(scores):
+    """
+    Fill the derived score columns of a batch in place with whole-column NumPy arithmetic
+    Same weights as calculate_evaluation_metrics
+    """
+    import numpy as np
     
-    # Ensure session directory exists
-    os.makedirs(session_dir, exist_ok=True)
+    syntax = scores['syntax_valid']
+    success = scores['execution_success']
+    code_length = scores['code_length']
+    execution_time = scores['execution_time']
     
-    # Metrics file path
-    metrics_file = os.path.join(session_dir, 'metrics.json')
+    scores['correctness_score'] = 0.5 * syntax + 0.5 * success
     
-    # Load existing metrics or create new list
-    metrics_list = []
-    if os.path.exists(metrics_file):
-        try:
-            with open(metrics_file, 'r', encoding='utf-8') as f:
-                metrics_list = json.load(f)
-        except (json.JSONDecodeError, IOError) as e:
-            print(f"Warning: Could not load existing metrics file: {e}. Creating new file.")
-            metrics_list = []
+    # Syntax: 30%, Safety: 30%, Readability: 20%, Structure: 20%
+    scores['quality_score'] = (0.3 * syntax + scores['safety_score'] * 0.3
+                               + scores['readability_score'] / 10 * 0.2 + 0.2 * scores['has_structure'])
+    
+    # Execution time (NaN = not measured, code length is used as a proxy)
+    length_bucket = np.searchsorted(_LENGTH_THRESHOLDS, code_length, side='right')
+    timed = np.take(_EXEC_TIME_SCORES, np.searchsorted(_EXEC_TIME_THRESHOLDS, execution_time, side='right'))
+    untimed = np.take(_LENGTH_PROXY_SCORES, length_bucket)
+    performance = np.where(np.isnan(execution_time), untimed, timed)
+    performance = performance + scores['time_complexity_score'] * 0.3
+    performance = performance + scores['space_complexity_score'] * 0.2
+    performance = performance + np.take(_LENGTH_SCORES, length_bucket)
+    scores['performance_score'] = performance + 0.1 * success
+    
+    scores['overall_score'] = batch_compute_overall_score(
+        np.column_stack([scores[column] for column in _OVERALL_COLUMNS]))
+
+def calculate_evaluation_metrics_batch(questions: List[str], generated_codes: List[str],
+                                       execution_results: List[Dict], csv_file: str,
+                                       execution_times: List[float] = None,
+                                       recovery_attempts: List[List[Dict]] = None):
+    """
+    Score a batch of samples into a column-per-score DataFrame
+    Per-sample checks fill a NumPy structured array; the weighted scores are then computed per column
+    """
+    import numpy as np
+    import pandas as pd
     
-    # Append new metrics to the list
-    metrics_list.append(metrics)
+    n = len(generated_codes)
+    if execution_times is None:
+        execution_times = [None] * n
+    if recovery_attempts is None:
+        recovery_attempts = [None] * n
+    
+    scores = np.zeros(n, dtype=_BATCH_DTYPE)
+    for i in range(n):
+        code = generated_codes[i]
+        execution_result = execution_results[i]
+        quality = check_code_quality(code)
+        row = scores[i]
+        row['syntax_valid'] = check_syntax_correctness(code)['syntax_valid']
+        row['execution_success'] = execution_result.get('type') != 'error'
+        row['has_structure'] = quality['has_imports'] and quality['line_count'] > 0
+        row['readability_score'] = quality['readability_score']
+        row['safety_score'] = check_code_safety(code)['safety_score']
+        row['code_length'] = len(code)
+        row['execution_time'] = np.nan if execution_times[i] is None else execution_times[i]
+        row['time_complexity_score'] = analyze_time_complexity(code)['score']
+        row['space_complexity_score'] = analyze_space_complexity(code, csv_file)['score']
+        row['understanding_score'] = analyze_prompt_understanding(questions[i], code, csv_file)['understanding_score']
+        row['coverage_score'] = analyze_requirement_coverage(questions[i], code)['coverage_score']
+        row['recovery_score'] = analyze_error_recovery(execution_result, recovery_attempts[i])['recovery_score']
+    
+    _finalize_scores(scores)
+    return pd.DataFrame(scores)
+
+def _evaluate_one(record: Dict) -> Dict:
+    """Score one batch record (module-level so worker processes can unpickle it)"""
+    return calculate_evaluation_metrics(
+        record['question'], record['generated_code'], record['execution_result'],
+        record['csv_file'], record['model'], record.get('execution_time'),
+        record.get('recovery_attempts')
+    )
+
+def evaluate_batch(records: List[Dict], workers: int = None) -> List[Dict]:
+    """
+    Run calculate_evaluation_metrics over many records in worker processes
+    Each record holds the calculate_evaluation_metrics arguments by name; results keep input order
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(records) <= 1:
+        return [_evaluate_one(record) for record in records]
+    
+    from concurrent.futures import ProcessPoolExecutor
+    chunksize = max(1, len(records) // (4 * workers))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_evaluate_one, records, chunksize=chunksize))
+
+def _json_dumps(obj, indent: bool = False) -> bytes:
+    """
+    Serialize to UTF-8 JSON bytes (compact unless indent), using orjson when it is installed
+    orjson writes UTF-8 directly, so large code strings skip the Python-level escape scan;
+    values neither encoder knows (datetimes, paths, ...) are written via str()
+    """
+    if orjson is not None:
+        options = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        return orjson.dumps(obj, default=str, option=options | (orjson.OPT_INDENT_2 if indent else 0))
+    if indent:
+        return json.dumps(obj, ensure_ascii=False, indent=2, default=str).encode('utf-8')
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'), default=str).encode('utf-8')
+
+def _json_loads(data):
+    """Parse JSON text or bytes, using orjson when it is installed"""
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+def _write_atomic(path: str, data: bytes):
+    """Write a file via a temp file and os.replace so readers never see a partial file"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+@functools.lru_cache(maxsize=None)
+def _ensure_session_dir(session_dir: str):
+    """Create a session directory; cached so repeat saves skip the mkdir syscall"""
+    os.makedirs(session_dir, exist_ok=True)
+
+def _load_legacy_metrics(session_dir: str) -> List[Dict]:
+    """Read the whole-array metrics.json written by older versions (empty if absent)"""
+    try:
+        with open(os.path.join(session_dir, 'metrics.json'), 'rb') as f:
+            return _json_loads(f.read())
+    except FileNotFoundError:
+        pass
+    except (json.JSONDecodeError, IOError) as e:
+        print(f"Warning: Could not load legacy metrics file: {e}")
+    return []
+
+def _parse_metrics_line(line: bytes) -> Optional[Dict]:
+    """Parse one metrics.jsonl line; None for blank or torn lines"""
+    if not line.strip():
+        return None
+    try:
+        return _json_loads(line)
+    except json.JSONDecodeError as e:
+        # A torn final line from an interrupted write; skip it
+        print(f"Warning: Skipping unreadable metrics line: {e}")
+        return None
+
+def iter_metrics(session_dir: str):
+    """
+    Yield a session's metrics entries one at a time
+    Legacy metrics.json arrays come first, then the append-only metrics.jsonl records (streamed line by line)
+    """
+    yield from _load_legacy_metrics(session_dir)
     
-    # Save updated metrics list
     try:
-        with open(metrics_file, 'w', encoding='utf-8') as f:
-            json.dump(metrics_list, f, ensure_ascii=False, indent=2)
-        print(f"[METRICS] Evaluation metrics saved to {metrics_file} (Total: {len(metrics_list)} entries)")
-    except IOError as e:
-        print(f"[METRICS ERROR] Error saving metrics to {metrics_file}: {e}")
-        import traceback
-        print(f"[METRICS ERROR] Traceback: {traceback.format_exc()}")
+        with open(os.path.join(session_dir, 'metrics.jsonl'), 'rb') as f:
+            for line in f:
+                entry = _parse_metrics_line(line)
+                if entry is not None:
+                    yield entry
+    except FileNotFoundError:
+        pass
+
+def load_metrics(session_dir: str) -> List[Dict]:
+    """
+    Load all metrics entries of a session into a list (same order as iter_metrics)
+    The line count is known after one read, so the list is allocated once at full size
+    """
+    metrics_list = _load_legacy_metrics(session_dir)
+    try:
+        with open(os.path.join(session_dir, 'metrics.jsonl'), 'rb') as f:
+            lines = f.read().splitlines()
+    except FileNotFoundError:
+        return metrics_list
+    
+    start = len(metrics_list)
+    metrics_list.extend([None] * len(lines))
+    for i, line in enumerate(lines, start):
+        metrics_list[i] = _parse_metrics_line(line)
+    # Drop the slots of blank or torn lines (rare, usually only a trailing one)
+    if None in metrics_list[start:]:
+        metrics_list[start:] = [m for m in metrics_list[start:] if m is not None]
+    return metrics_list
+
+# Score averages in the summary and where each score lives in a metrics entry
+_SUMMARY_SCORES = (
+    ('overall', None, 'overall_score'),
+    ('correctness', 'code_correctness', 'correctness_score'),
+    ('quality', 'code_quality', 'quality_score'),
+    ('performance', 'performance', 'performance_score'),
+    ('understanding', 'prompt_understanding', 'understanding_score'),
+    ('coverage', 'requirement_coverage', 'coverage_score'),
+    ('recovery', 'error_recovery', 'recovery_score'),
+)
+
+def _new_totals() -> Dict:
+    """Empty running totals for a session summary (sums and counts, not averages)"""
+    return {
+        'entries': 0,
+        'sums': {name: 0.0 for name, _, _ in _SUMMARY_SCORES},
+        'execution_time_sum': 0.0,
+        'execution_time_count': 0,
+        'successful_executions': 0,
+        'errors_encountered': 0,
+        'total_recovery_attempts': 0,
+        'successful_recoveries': 0,
+        'models_used': [],
+        'time_complexity_distribution': {},
+        'space_complexity_distribution': {}
+    }
+
+def _score_of(m: Dict, section: Optional[str], key: str) -> float:
+    """Read one summary score from a metrics entry (0 when missing)"""
+    return m.get(key, 0) if section is None else (m.get(section) or {}).get(key, 0)
+
+def _accumulate_metrics(totals: Dict, m: Dict, include_scores: bool = True):
+    """Add one metrics entry to the running totals (score sums only if include_scores)"""
+    # Bind each section once instead of repeating m.get(section, {}) lookups
+    perf = m.get('performance') or {}
+    er = m.get('error_recovery') or {}
+    
+    totals['entries'] += 1
+    if include_scores:
+        sums = totals['sums']
+        for name, section, key in _SUMMARY_SCORES:
+            sums[name] += _score_of(m, section, key)
+    
+    execution_time = perf.get('execution_time_seconds')
+    if execution_time is not None:
+        totals['execution_time_sum'] += execution_time
+        totals['execution_time_count'] += 1
+    
+    time_counts = totals['time_complexity_distribution']
+    notation = (perf.get('time_complexity') or {}).get('notation', 'O(1)')
+    time_counts[notation] = time_counts.get(notation, 0) + 1
+    space_counts = totals['space_complexity_distribution']
+    notation = (perf.get('space_complexity') or {}).get('notation', 'O(1)')
+    space_counts[notation] = space_counts.get(notation, 0) + 1
+    
+    model = m.get('model', 'unknown')
+    if model not in totals['models_used']:
+        totals['models_used'].append(model)
+    
+    if (m.get('code_correctness') or {}).get('execution_success', False):
+        totals['successful_executions'] += 1
+    totals['total_recovery_attempts'] += er.get('recovery_attempts_count', 0)
+    if er.get('recovery_success', False):
+        totals['successful_recoveries'] += 1
+    if er.get('has_error', False):
+        totals['errors_encountered'] += 1
+
+def _rebuild_totals(metrics_list: List[Dict]) -> Dict:
+    """
+    Recompute running totals from a full metrics history
+    Large histories sum each score column with NumPy instead of per-entry float adds
+    """
+    totals = _new_totals()
+    n = len(metrics_list)
+    np = None
+    if n > 64:
+        try:
+            import numpy as np
+        except ImportError:
+            pass
     
-    # Also maintain a summary file for quick access
+    for m in metrics_list:
+        _accumulate_metrics(totals, m, include_scores=np is None)
+    if np is not None:
+        for name, section, key in _SUMMARY_SCORES:
+            column = np.fromiter((_score_of(m, section, key) for m in metrics_list), dtype=np.float64, count=n)
+            totals['sums'][name] = float(column.sum())
+    return totals
+
+def _summary_from_totals(totals: Dict) -> Dict:
+    """Derive the displayed summary (averages, rates) from running totals"""
+    n = totals['entries']
+    sums = totals['sums']
+    execution_time_count = totals['execution_time_count']
+    avg_execution_time = totals['execution_time_sum'] / execution_time_count if execution_time_count else None
+    errors_encountered = totals['errors_encountered']
+    successful_recoveries = totals['successful_recoveries']
+    summary = {f'average_{name}_score': sums[name] / n if n else 0 for name, _, _ in _SUMMARY_SCORES}
+    summary.update({
+        'average_execution_time_seconds': avg_execution_time,
+        'average_execution_time_ms': (avg_execution_time * 1000) if avg_execution_time else None,
+        'models_used': list(totals['models_used']),
+        'total_questions': n,
+        'successful_executions': totals['successful_executions'],
+        'errors_encountered': errors_encountered,
+        'total_recovery_attempts': totals['total_recovery_attempts'],
+        'successful_recoveries': successful_recoveries,
+        'recovery_success_rate': (successful_recoveries / errors_encountered) if errors_encountered > 0 else 0.0,
+        'time_complexity_distribution': dict(totals['time_complexity_distribution']),
+        'space_complexity_distribution': dict(totals['space_complexity_distribution'])
+    })
+    return summary
+
+def _write_summary(session_id: str, session_dir: str, totals: Dict):
+    """Write metrics_summary.json (displayed summary plus the raw running totals)"""
     summary_file = os.path.join(session_dir, 'metrics_summary.json')
-    
-    # Calculate averages for execution time
-    execution_times = [m.get('performance', {}).get('execution_time_seconds') 
-                      for m in metrics_list 
-                      if m.get('performance', {}).get('execution_time_seconds') is not None]
-    avg_execution_time = sum(execution_times) / len(execution_times) if execution_times else None
-    
-    # Collect time and space complexity notations
-    time_complexities = [m.get('performance', {}).get('time_complexity', {}).get('notation', 'O(1)') 
-                        for m in metrics_list]
-    space_complexities = [m.get('performance', {}).get('space_complexity', {}).get('notation', 'O(1)') 
-                         for m in metrics_list]
-    
-    # Calculate averages for new metrics
-    understanding_scores = [m.get('prompt_understanding', {}).get('understanding_score', 0) 
-                           for m in metrics_list]
-    coverage_scores = [m.get('requirement_coverage', {}).get('coverage_score', 0) 
-                      for m in metrics_list]
-    recovery_scores = [m.get('error_recovery', {}).get('recovery_score', 0) 
-                      for m in metrics_list]
-    
-    # Calculate recovery statistics
-    total_recovery_attempts = sum(m.get('error_recovery', {}).get('recovery_attempts_count', 0) 
-                                  for m in metrics_list)
-    successful_recoveries = sum(1 for m in metrics_list 
-                               if m.get('error_recovery', {}).get('recovery_success', False))
-    errors_encountered = sum(1 for m in metrics_list 
-                            if m.get('error_recovery', {}).get('has_error', False))
-    
+    try:
+        metrics_size = os.path.getsize(os.path.join(session_dir, 'metrics.jsonl'))
+    except OSError:
+        metrics_size = 0
     summary_data = {
         'session_id': session_id,
-        'total_entries': len(metrics_list),
+        'total_entries': totals['entries'],
         'last_updated': datetime.now().isoformat(),
-        'summary': {
-            'average_overall_score': sum(m.get('overall_score', 0) for m in metrics_list) / len(metrics_list) if metrics_list else 0,
-            'average_correctness_score': sum(m.get('code_correctness', {}).get('correctness_score', 0) for m in metrics_list) / len(metrics_list) if metrics_list else 0,
-            'average_quality_score': sum(m.get('code_quality', {}).get('quality_score', 0) for m in metrics_list) / len(metrics_list) if metrics_list else 0,
-            'average_performance_score': sum(m.get('performance', {}).get('performance_score', 0) for m in metrics_list) / len(metrics_list) if metrics_list else 0,
-            'average_understanding_score': sum(understanding_scores) / len(understanding_scores) if understanding_scores else 0,
-            'average_coverage_score': sum(coverage_scores) / len(coverage_scores) if coverage_scores else 0,
-            'average_recovery_score': sum(recovery_scores) / len(recovery_scores) if recovery_scores else 0,
-            'average_execution_time_seconds': avg_execution_time,
-            'average_execution_time_ms': (avg_execution_time * 1000) if avg_execution_time else None,
-            'models_used': list(set(m.get('model', 'unknown') for m in metrics_list)),
-            'total_questions': len(metrics_list),
-            'successful_executions': sum(1 for m in metrics_list if m.get('code_correctness', {}).get('execution_success', False)),
-            'errors_encountered': errors_encountered,
-            'total_recovery_attempts': total_recovery_attempts,
-            'successful_recoveries': successful_recoveries,
-            'recovery_success_rate': (successful_recoveries / errors_encountered) if errors_encountered > 0 else 0.0,
-            'time_complexity_distribution': {
-                complexity: time_complexities.count(complexity) 
-                for complexity in set(time_complexities)
-            },
-            'space_complexity_distribution': {
-                complexity: space_complexities.count(complexity) 
-                for complexity in set(space_complexities)
-            }
-        }
+        'summary': _summary_from_totals(totals),
+        '_totals': totals,
+        # Size of metrics.jsonl these totals cover; a mismatch means a debounced write was lost
+        '_metrics_size': metrics_size
     }
     
     try:
-        with open(summary_file, 'w', encoding='utf-8') as f:
-            json.dump(summary_data, f, ensure_ascii=False, indent=2)
+        _write_atomic(summary_file, _json_dumps(summary_data, indent=True))
         print(f"[METRICS] Metrics summary saved to {summary_file}")
     except IOError as e:
         print(f"[METRICS ERROR] Error saving metrics summary: {e}")
-        import traceback
         print(f"[METRICS ERROR] Traceback: {traceback.format_exc()}")
+    _SUMMARY_PENDING.pop(session_dir, None)
+    _LAST_SUMMARY_WRITE[session_dir] = time.monotonic()
+
+def rebuild_summary_from_disk(session_id: str, session_dir: str = None) -> Dict:
+    """
+    Recompute a session's summary by streaming its metrics files
+    Entries are folded into the running totals one at a time, so the history is never held in memory
+    """
+    if session_dir is None:
+        session_dir = os.path.join('chat_history', session_id)
+    totals = _new_totals()
+    for m in iter_metrics(session_dir):
+        _accumulate_metrics(totals, m)
+    _SESSION_TOTALS[session_dir] = totals
+    _write_summary(session_id, session_dir, totals)
+    return totals
+
+# Running summary totals per session directory, kept in memory so saves skip re-reading the summary
+_SESSION_TOTALS: Dict[str, Dict] = {}
+
+# Summary writes are debounced: rewritten at most every _SUMMARY_WRITE_INTERVAL seconds,
+# and on every _SUMMARY_WRITE_EVERY-th entry; in between the totals are only kept in memory
+# and a timer writes them once the interval has passed (the trailing edge of a burst)
+_SUMMARY_WRITE_INTERVAL = 2.0
+_SUMMARY_WRITE_EVERY = 10
+_LAST_SUMMARY_WRITE: Dict[str, float] = {}
+# session_dir -> session_id for sessions whose summary file is behind _SESSION_TOTALS
+_SUMMARY_PENDING: Dict[str, str] = {}
+_SUMMARY_TIMERS: Dict[str, threading.Timer] = {}
+# Guards the totals and summary state above against the flush timers
+_SUMMARY_LOCK = threading.RLock()
+
+def _schedule_summary_flush(session_id: str, session_dir: str):
+    """Start a timer that writes the pending summary when the debounce interval ends"""
+    if session_dir in _SUMMARY_TIMERS:
+        return
+    delay = _LAST_SUMMARY_WRITE.get(session_dir, 0.0) + _SUMMARY_WRITE_INTERVAL - time.monotonic()
+    timer = threading.Timer(max(delay, 0.0), _flush_summary_timer, (session_id, session_dir))
+    timer.daemon = True
+    _SUMMARY_TIMERS[session_dir] = timer
+    timer.start()
+
+def _flush_summary_timer(session_id: str, session_dir: str):
+    with _SUMMARY_LOCK:
+        _SUMMARY_TIMERS.pop(session_dir, None)
+        flush_summary(session_id, session_dir)
+
+def flush_summary(session_id: str, session_dir: str = None):
+    """Write a session's pending summary now (call at the end of a session)"""
+    if session_dir is None:
+        session_dir = os.path.join('chat_history', session_id)
+    with _SUMMARY_LOCK:
+        if session_dir in _SUMMARY_PENDING and session_dir in _SESSION_TOTALS:
+            _write_summary(session_id, session_dir, _SESSION_TOTALS[session_dir])
+
+@atexit.register
+def _flush_all_summaries():
+    """Write every pending summary before the interpreter exits"""
+    for session_dir, session_id in list(_SUMMARY_PENDING.items()):
+        flush_summary(session_id, session_dir)
+
+def flush_metrics(session_id: str, session_dir: str = None):
+    """Drop a session's in-memory summary totals (call when the session ends or is deleted)"""
+    if session_dir is None:
+        session_dir = os.path.join('chat_history', session_id)
+    with _SUMMARY_LOCK:
+        timer = _SUMMARY_TIMERS.pop(session_dir, None)
+        if timer is not None:
+            timer.cancel()
+        _SESSION_TOTALS.pop(session_dir, None)
+        _SUMMARY_PENDING.pop(session_dir, None)
+        _LAST_SUMMARY_WRITE.pop(session_dir, None)
 
+def save_evaluation_metrics(session_id: str, metrics: Dict, session_dir: str = None):
+    """
+    Save evaluation metrics to session directory
+    Each entry is appended as one JSON line to chat_history/{session_id}/metrics.jsonl
+    """
+    # Determine session directory
+    if session_dir is None:
+        session_dir = os.path.join('chat_history', session_id)
+    
+    # Ensure session directory exists (once per process per directory)
+    _ensure_session_dir(session_dir)
+    
+    # Metrics file path
+    metrics_file = os.path.join(session_dir, 'metrics.jsonl')
+    
+    # Append the new entry; earlier entries are never re-serialized
+    size_before = None
+    try:
+        try:
+            f = open(metrics_file, 'ab')
+        except FileNotFoundError:
+            # The directory was removed after it was first created (e.g. session deleted)
+            _ensure_session_dir.cache_clear()
+            _ensure_session_dir(session_dir)
+            f = open(metrics_file, 'ab')
+        with f:
+            size_before = f.tell()
+            f.write(_json_dumps(metrics) + b'\n')
+    except IOError as e:
+        print(f"[METRICS ERROR] Error saving metrics to {metrics_file}: {e}")
+        print(f"[METRICS ERROR] Traceback: {traceback.format_exc()}")
+    
+    # Also maintain a summary file for quick access
+    summary_file = os.path.join(session_dir, 'metrics_summary.json')
+    
+    with _SUMMARY_LOCK:
+        # Update the stored running totals with just the new entry; sessions without
+        # totals (older summaries, or none yet) are rebuilt from the full history once
+        totals = _SESSION_TOTALS.get(session_dir)
+        if totals is None:
+            # First save in this process: pick up the totals stored in the summary file
+            try:
+                with open(summary_file, 'rb') as f:
+                    stored = _json_loads(f.read())
+                # Only trust totals that cover exactly the entries written before this one
+                if stored.get('_metrics_size', size_before) == size_before:
+                    totals = stored.get('_totals')
+            except FileNotFoundError:
+                pass
+            except (json.JSONDecodeError, IOError) as e:
+                print(f"Warning: Could not load metrics summary: {e}. Rebuilding it.")
+            if totals is None:
+                totals = _rebuild_totals(load_metrics(session_dir))
+            else:
+                _accumulate_metrics(totals, metrics)
+            _SESSION_TOTALS[session_dir] = totals
+        else:
+            _accumulate_metrics(totals, metrics)
+        print(f"[METRICS] Evaluation metrics saved to {metrics_file} (Total: {totals['entries']} entries)")
+        
+        # Debounced summary write (see _SUMMARY_WRITE_INTERVAL); a timer writes the rest
+        recently_written = time.monotonic() - _LAST_SUMMARY_WRITE.get(session_dir, float('-inf')) < _SUMMARY_WRITE_INTERVAL
+        if recently_written and totals['entries'] % _SUMMARY_WRITE_EVERY != 0:
+            _SUMMARY_PENDING[session_dir] = session_id
+            _schedule_summary_flush(session_id, session_dir)
+            return
+        _write_summary(session_id, session_dir, totals)
@@ -4,48 +4,102 @@ python frontend.py
 '''
 
 from flask import Flask, render_template, request, jsonify, session
+from flask.json.provider import DefaultJSONProvider
 import os
 import json
 from datetime import datetime
 import uuid
 import webbrowser
 import threading
+import atexit
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 import time
 import hashlib
+import io
+import re
+from functools import lru_cache
 import pandas as pd
 import numpy as np
-from dotenv import load_dotenv
 from openai import OpenAI
 import requests
-import base64
-import io
+import asyncio
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+try:
+    from flask_session import Session as ServerSideSession
+except ImportError:
+    ServerSideSession = None
 
-# Load environment variables
-load_dotenv()
+# `python frontend.py` makes this file the main module, and spawned code-execution workers re-run
+# it as __mp_main__ before unpickling their tasks. They only need code_executor, so they skip
+# loading .env, creating directories, the API clients and the LLM cache.
+_IN_EXEC_WORKER = __name__ == '__mp_main__'
 
-# Check if .env file exists
-if not os.path.exists('.env'):
-    print("Warning: .env file does not exist! Please run setup_env.bat to create .env file.")
+# Load environment variables (production injects them, so skip .env entirely)
+if os.environ.get('FLASK_ENV') != 'production' and not _IN_EXEC_WORKER:
+    from config import load_env_file
+
+    # Check if .env file exists
+    if not load_env_file():
+        print("Warning: .env file does not exist! Please run setup_env.bat to create .env file.")
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson (NaN/Infinity are sent as null, which browsers can parse)"""
+    
+    def _options(self):
+        options = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        return options | orjson.OPT_SORT_KEYS if self.sort_keys else options
+    
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=self._options()).decode('utf-8')
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+    
+    def response(self, *args, **kwargs):
+        # Hand orjson's bytes to the response directly instead of round-tripping through str
+        obj = self._prepare_response_obj(args, kwargs)
+        body = orjson.dumps(obj, default=self.default, option=self._options()) + b'\n'
+        return self._app.response_class(body, mimetype=self.mimetype)
 
 app = Flask(__name__)
+if orjson is not None:
+    app.json = OrjsonProvider(app)
 app.secret_key = os.getenv('SECRET_KEY', 'your-secret-key-here-change-in-production')
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 
 # Ensure upload directories exist
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-os.makedirs('chat_history', exist_ok=True)
-os.makedirs('data', exist_ok=True)
-os.makedirs('evaluation_results', exist_ok=True)
+if not _IN_EXEC_WORKER:
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    os.makedirs('chat_history', exist_ok=True)
+    os.makedirs('data', exist_ok=True)
+    os.makedirs('evaluation_results', exist_ok=True)
 
 # Initialize LLM providers
 from llm_providers.openrouter_provider import OpenRouterProvider
 from llm_providers.openai_provider import OpenAIProvider
-from evaluation_metrics import calculate_evaluation_metrics, save_evaluation_metrics
+from llm_providers.event_loop import run_coroutine
+from llm_cache import LLMCache, sentence_transformer_embedder
+from code_executor import execute_code, init_worker
+from evaluation_metrics import calculate_evaluation_metrics, save_evaluation_metrics, flush_metrics, _json_dumps, _json_loads
 
 # Initialize OpenAI provider for GPT-4
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
-if not OPENAI_API_KEY:
+if _IN_EXEC_WORKER:
+    openai_provider = None
+elif not OPENAI_API_KEY:
     print("Warning: OPENAI_API_KEY not set. GPT-4 will not be available.")
     openai_provider = None
 else:
@@ -54,13 +108,22 @@ else:
 
 # Initialize OpenRouter provider for other models
 OPENROUTER_API_KEY = os.getenv('OPENROUTER_API_KEY')
-if not OPENROUTER_API_KEY:
+if _IN_EXEC_WORKER:
+    openrouter_provider = None
+elif not OPENROUTER_API_KEY:
     print("Warning: OPENROUTER_API_KEY not set. OpenRouter models will not be available.")
     openrouter_provider = None
 else:
     openrouter_provider = OpenRouterProvider(api_key=OPENROUTER_API_KEY)
     print("✓ OpenRouter API client initialized successfully")
 
+# Cache of generated code that ran successfully; semantic lookups embed questions locally with
+# sentence-transformers when it is installed, otherwise with the OpenAI embeddings API
+llm_cache = None if _IN_EXEC_WORKER else LLMCache(
+    embed_fn=sentence_transformer_embedder() or (openai_provider.embed if openai_provider else None),
+    threshold=float(os.getenv('LLM_CACHE_SIMILARITY', '0.92'))
+)
+
 # Available models configuration
 # GPT-4 uses OpenAI API directly, others use OpenRouter
 AVAILABLE_MODELS = {
@@ -82,6 +145,18 @@ AVAILABLE_MODELS = {
     }
 }
 
+# model name -> (provider object or None if its API key is missing, model id, error if unavailable)
+_PROVIDER_ERRORS = {
+    "openai": "OpenAI API key not configured. Please set OPENAI_API_KEY in .env file.",
+    "openrouter": "OpenRouter API key not configured. Please set OPENROUTER_API_KEY in .env file.",
+}
+_PROVIDERS = {"openai": openai_provider, "openrouter": openrouter_provider}
+_MODEL_DISPATCH = {
+    name: (_PROVIDERS.get(cfg["provider"]), cfg["model_id"],
+           _PROVIDER_ERRORS.get(cfg["provider"], f"Unknown provider type: {cfg['provider']}"))
+    for name, cfg in AVAILABLE_MODELS.items()
+}
+
 # Smithery configuration
 SMITHERY_API_KEY = os.getenv('SMITHERY_API_KEY')
 SMITHERY_PROFILE_ID = os.getenv('SMITHERY_PROFILE_ID')
@@ -90,6 +165,37 @@ SMITHERY_API_URL = 'https://api.smithery.ai/v1'
 # Dictionary to store chat sessions (should use database in production)
 chat_sessions = {}
 
+# Optional Redis session store, e.g. REDIS_URL=unix:///var/run/redis/redis.sock (avoids TCP overhead)
+REDIS_URL = os.getenv('REDIS_URL')
+if REDIS_URL and redis is None:
+    print("Warning: REDIS_URL is set but the redis package is not installed. Sessions are stored on disk.")
+redis_client = redis.Redis.from_url(REDIS_URL) if (REDIS_URL and redis is not None) else None
+
+# Keep Flask's session server-side in the same Redis (Flask-Session) instead of a signed cookie
+if redis_client is not None and ServerSideSession is not None:
+    app.config['SESSION_TYPE'] = 'redis'
+    app.config['SESSION_REDIS'] = redis_client
+    # Distinct prefix so Flask sessions never collide with the session:{id} chat keys
+    app.config['SESSION_KEY_PREFIX'] = 'flask_session:'
+    ServerSideSession(app)
+
+# Session lists that only ever grow; they are stored as Redis lists or {name}.jsonl files
+# so each save appends just the new items
+_SESSION_LISTS = ('messages', 'history')
+# session_id -> {list name: (list object, number of its items already persisted)}
+_persisted_lengths = {}
+# session_id -> serialized metadata last written to session.json
+_persisted_meta = {}
+
+# Write-behind: save_chat_session marks a session dirty and a background thread writes
+# dirty sessions every _SESSION_WRITE_INTERVAL seconds, coalescing bursts into one write
+_SESSION_WRITE_INTERVAL = 0.25
+_dirty = set()
+_dirty_lock = threading.Lock()
+# Held while a session is written or deleted, so a delete never races a pending write
+_session_write_lock = threading.Lock()
+_session_writer = None
+
 # Global variable: prevent duplicate browser opening
 _browser_opened = False
 
@@ -158,23 +264,134 @@ def delete_chat(session_id):
                 except Exception as e:
                     print(f"Error deleting CSV file {csv_file}: {e}")
             
-            # Delete session data
-            del chat_sessions[session_id]
         
-        # Delete history directory (includes session.json, metrics.json, and metrics_summary.json)
+        # Drop the session and any pending write-behind save before removing its files
+        with _session_write_lock:
+            chat_sessions.pop(session_id, None)
+            with _dirty_lock:
+                _dirty.discard(session_id)
+            if redis_client is not None:
+                _delete_chat_session_redis(session_id)
+            _persisted_lengths.pop(session_id, None)
+            _persisted_meta.pop(session_id, None)
+        
+        # Delete history directory (includes session.json, messages/history.jsonl, metrics.jsonl, and metrics_summary.json)
         session_dir = os.path.join('chat_history', session_id)
-        if os.path.exists(session_dir):
-            try:
-                shutil.rmtree(session_dir)
-                print(f"Deleted session directory: {session_dir} (including all metrics)")
-            except Exception as e:
-                print(f"Error deleting session directory {session_dir}: {e}")
+        with _session_write_lock, _metrics_save_lock:  # not while a background save is writing there
+            flush_metrics(session_id, session_dir=session_dir)
+            if os.path.exists(session_dir):
+                try:
+                    shutil.rmtree(session_dir)
+                    print(f"Deleted session directory: {session_dir} (including all metrics)")
+                except Exception as e:
+                    print(f"Error deleting session directory {session_dir}: {e}")
         
         return jsonify({'success': True})
     except Exception as e:
         print(f"Error deleting session {session_id}: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+# Uploads are read in 64KB blocks; previews parse the CSV in row chunks
+_UPLOAD_BLOCK_SIZE = 64 * 1024
+_PREVIEW_CHUNK_ROWS = 50_000
+
+class _TeeReader(io.RawIOBase):
+    """Binary reader over an upload stream that writes every block it reads to a file and a hash,
+    so saving, hashing and parsing the upload share a single pass over its bytes"""
+
+    def __init__(self, stream, out, hasher):
+        self._stream = stream
+        self._out = out
+        self._hasher = hasher
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        block = self._stream.read(len(buffer))
+        n = len(block)
+        buffer[:n] = block
+        self._hasher.update(block)
+        self._out.write(block)
+        return n
+
+    def drain(self):
+        """Copy whatever the parser did not read"""
+        for block in iter(lambda: self._stream.read(_UPLOAD_BLOCK_SIZE), b''):
+            self._hasher.update(block)
+            self._out.write(block)
+
+def _merge_dtype(a, b):
+    """dtype pandas infers for a column whose chunks were inferred as a and b"""
+    if a == b:
+        return a
+    if a.kind in 'iuf' and b.kind in 'iuf':
+        return np.result_type(a, b)
+    # Numbers or booleans mixed with text: the column is parsed as text
+    for dtype in (a, b):
+        if dtype.kind not in 'iufb':
+            return dtype
+    return np.dtype(object)
+
+def _csv_preview(source, filepath):
+    """Shape, dtypes, sample rows and null counts of a CSV read from source (a path or binary reader),
+    parsed chunk by chunk so memory stays at one chunk instead of the whole file
+    Returns None for a header-only CSV when filepath is None (nothing to re-read yet)"""
+    rows = 0
+    head = None
+    dtypes = {}
+    null_counts = None
+    for chunk in pd.read_csv(source, chunksize=_PREVIEW_CHUNK_ROWS):
+        if head is None:
+            head = chunk.head(5)
+            dtypes = dict(chunk.dtypes)
+            null_counts = chunk.isnull().sum()
+        else:
+            for col, dtype in chunk.dtypes.items():
+                dtypes[col] = _merge_dtype(dtypes[col], dtype)
+            null_counts += chunk.isnull().sum()
+        rows += len(chunk)
+    
+    if head is None:
+        # Header only: no chunks are produced; re-read the saved file once it is complete
+        if filepath is None:
+            return None
+        head = pd.read_csv(filepath)
+        dtypes = dict(head.dtypes)
+        null_counts = head.isnull().sum()
+    
+    # Show sample rows with the dtypes of the whole file (e.g. ints that become floats in a later chunk)
+    changed = {col: dtype for col, dtype in dtypes.items() if head[col].dtype != dtype}
+    if changed:
+        head = head.astype(changed)
+    
+    return {
+        'shape': {'rows': rows, 'columns': len(head.columns)},
+        'columns': head.columns.tolist(),
+        'dtypes': {col: str(dtype) for col, dtype in dtypes.items()},
+        'sample_data': head.to_dict('records'),
+        'null_counts': null_counts.to_dict()
+    }
+
+# csv_hash -> {'columns', 'dtypes'} for the system prompt, filled from the upload scan
+_CSV_INFO_MAX = 32
+_csv_infos = {}
+
+def _remember_csv_info(csv_hash, preview):
+    _csv_infos[csv_hash] = {'columns': preview['columns'], 'dtypes': preview['dtypes']}
+    while len(_csv_infos) > _CSV_INFO_MAX:
+        _csv_infos.pop(next(iter(_csv_infos)), None)
+
+def _csv_info(csv_hash, csv_path):
+    """Columns and dtypes of a CSV, scanned at most once per content hash"""
+    key = csv_hash or csv_path
+    info = _csv_infos.get(key)
+    if info is None:
+        # Chunked scan: header-only reads (nrows=0) would report every column as object
+        _remember_csv_info(key, _csv_preview(csv_path, csv_path))
+        info = _csv_infos[key]
+    return info
+
 @app.route('/api/upload', methods=['POST'])
 def upload_file():
     """Handle file upload and preview CSV data"""
@@ -190,31 +407,24 @@ def upload_file():
         return jsonify({'error': 'Only CSV files are allowed'}), 400
     
     try:
-        # Read CSV file
-        file_content = file.read()
-        file.seek(0)  # Reset file pointer
-        
-        # Calculate file hash
-        file_hash = hashlib.sha256(file_content).hexdigest()
-        
-        # Save file
+        # Save, hash and preview the file in one pass: the CSV parser reads the upload
+        # stream through a reader that also writes each block to disk and to the hash
         session_id = session.get('session_id', str(uuid.uuid4()))
         filename = f"{session_id}_{file.filename}"
         filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
-        
-        # Read CSV for preview
-        df = pd.read_csv(io.BytesIO(file_content))
-        
-        # Get data preview information
-        preview_data = {
-            'shape': {'rows': len(df), 'columns': len(df.columns)},
-            'columns': df.columns.tolist(),
-            'dtypes': df.dtypes.astype(str).to_dict(),
-            'sample_data': df.head(5).to_dict('records'),
-            'null_counts': df.isnull().sum().to_dict(),
-            'file_hash': file_hash
-        }
+        hasher = hashlib.sha256()
+        with open(filepath, 'wb') as out:
+            tee = _TeeReader(file.stream, out, hasher)
+            try:
+                preview_source = io.BufferedReader(tee, _UPLOAD_BLOCK_SIZE)
+                preview_data = _csv_preview(preview_source, None)
+            finally:
+                tee.drain()
+        if preview_data is None:
+            preview_data = _csv_preview(filepath, filepath)
+        file_hash = hasher.hexdigest()
+        preview_data['file_hash'] = file_hash
+        _remember_csv_info(file_hash, preview_data)
         
         # Update session file information
         if session_id not in chat_sessions:
@@ -243,17 +453,9 @@ def upload_file():
     except Exception as e:
         return jsonify({'error': f'Error processing CSV: {str(e)}'}), 400
 
-def generate_pandas_code(question, csv_info, model="gpt-4"):
-    """Generate Pandas code using appropriate provider based on model"""
-    columns = csv_info.get('columns', [])
-    dtypes = csv_info.get('dtypes', {})
-    
-    # Get model configuration
-    model_config = AVAILABLE_MODELS.get(model, AVAILABLE_MODELS["gpt-4"])
-    provider_type = model_config["provider"]
-    model_id = model_config["model_id"]
-    
-    system_prompt = """You are a data analysis assistant. Convert natural language questions into safe, read-only Pandas code.
+# Static instructions come first and are byte-identical on every call, so providers with
+# prompt-prefix caching can reuse them; the per-CSV schema is appended after them
+_SYSTEM_PROMPT_PREFIX = """You are a data analysis assistant. Convert natural language questions into safe, read-only Pandas code.
 
 Rules:
 1. Only use read-only operations (no file writes, no network calls, no system commands)
@@ -264,9 +466,6 @@ Rules:
 6. Return only valid Python/Pandas code, no explanations or markdown
 7. Import necessary libraries (matplotlib.pyplot as plt, seaborn as sns if needed)
 
-Available columns: {columns}
-Column types: {dtypes}
-
 Examples:
 - For calculations: result = df['column'].mean()
 - For filtering: result = df[df['column'] > 10]
@@ -276,154 +475,125 @@ Examples:
   ax.plot(df['x'], df['y'])
   fig = plt.gcf()
 
-Return ONLY the Python code, nothing else.""".format(
+Return ONLY the Python code, nothing else.
+
+"""
+
+_SCHEMA_CONTEXT_TEMPLATE = """Available columns: {columns}
+Column types: {dtypes}"""
+
+@lru_cache(maxsize=32)
+def _render_system_prompt(columns, dtype_items):
+    """Render the system prompt once per schema (columns and dtypes as hashable tuples)"""
+    return _SYSTEM_PROMPT_PREFIX + _SCHEMA_CONTEXT_TEMPLATE.format(
         columns=', '.join(columns),
-        dtypes=json.dumps(dtypes)
+        dtypes=json.dumps(dict(dtype_items))
     )
+
+def _build_system_prompt(csv_info):
+    """Build the code generation system prompt for a CSV schema"""
+    columns = csv_info.get('columns', [])
+    dtypes = csv_info.get('dtypes', {})
+    return _render_system_prompt(tuple(columns), tuple(dtypes.items()))
+
+# A whole response wrapped in a markdown code fence (```python ... ```)
+_FENCE_RE = re.compile(r'^\s*```[ \t]*(?:python|py)?[ \t]*\n?(.*?)\n?\s*```\s*$', re.DOTALL)
+
+def _clean_code(code):
+    """Remove code block markers from a model response"""
+    match = _FENCE_RE.match(code)
+    if match:
+        return match.group(1).strip()
+    # Unbalanced fence (e.g. a truncated response)
+    return code.strip().removeprefix('```python').removeprefix('```').removesuffix('```').strip()
+
+async def agenerate_pandas_code(question, csv_info, model="gpt-4"):
+    """Generate Pandas code without blocking; providers without an async client run in a worker thread"""
+    provider, model_id, unavailable = _MODEL_DISPATCH.get(model) or _MODEL_DISPATCH["gpt-4"]
+    system_prompt = _build_system_prompt(csv_info)
     
     try:
-        # Select provider based on model
-        if provider_type == "openai":
-            if not openai_provider:
-                raise Exception("OpenAI API key not configured. Please set OPENAI_API_KEY in .env file.")
-            code = openai_provider.generate_code(
-                system_prompt=system_prompt,
-                user_prompt=question,
-                model=model_id,
-                temperature=0.3,
-                max_tokens=1000
-            )
-        elif provider_type == "openrouter":
-            if not openrouter_provider:
-                raise Exception("OpenRouter API key not configured. Please set OPENROUTER_API_KEY in .env file.")
-            code = openrouter_provider.generate_code(
-                system_prompt=system_prompt,
-                user_prompt=question,
-                model=model_id,
-                temperature=0.3,
-                max_tokens=1000
-            )
+        if provider is None:
+            raise Exception(unavailable)
+        
+        kwargs = dict(
+            system_prompt=system_prompt,
+            system_prefix=_SYSTEM_PROMPT_PREFIX,
+            user_prompt=question,
+            model=model_id,
+            temperature=0.3,
+            max_tokens=1000
+        )
+        # Providers queue behind the model's request/token rate limits themselves
+        if hasattr(provider, 'agenerate_code'):
+            code = await provider.agenerate_code(**kwargs)
         else:
-            raise Exception(f"Unknown provider type: {provider_type}")
+            code = await asyncio.to_thread(provider.generate_code, **kwargs)
         
-        # Remove code block markers
-        if code.startswith('```python'):
-            code = code[9:]
-        if code.startswith('```'):
-            code = code[3:]
-        if code.endswith('```'):
-            code = code[:-3]
-        return code.strip()
+        return _clean_code(code)
     except Exception as e:
         raise Exception(f"Error generating code: {str(e)}")
 
-def execute_code_safely(code, csv_filepath):
-    """Safely execute code in a controlled environment"""
-    execution_time = None
+async def _agenerate_candidates(question, csv_info, model, count):
+    """Generate several answers to one prompt concurrently (failures are returned as exceptions)"""
+    return await asyncio.gather(
+        *[agenerate_pandas_code(question, csv_info, model=model) for _ in range(count)],
+        return_exceptions=True
+    )
+
+def generate_pandas_code(question, csv_info, model="gpt-4"):
+    """Generate Pandas code using appropriate provider based on model"""
+    return run_coroutine(agenerate_pandas_code(question, csv_info, model=model))
+
+# Generated code runs in persistent worker processes (EXEC_WORKERS=0 runs it in-process)
+EXEC_WORKERS = int(os.getenv('EXEC_WORKERS', min(4, os.cpu_count() or 1)))
+_exec_pool = None
+_exec_pool_lock = threading.Lock()
+
+def _get_exec_pool():
+    """
+    Create the execution pool on first use; workers are started once and reused across requests.
+    Returns None when worker processes can't be started here, and code then runs in-process.
+    """
+    global _exec_pool, EXEC_WORKERS
+    with _exec_pool_lock:
+        if _exec_pool is None and EXEC_WORKERS > 0:
+            try:
+                # spawn is available on every platform and doesn't copy the app's threads into the workers
+                _exec_pool = ProcessPoolExecutor(max_workers=EXEC_WORKERS, mp_context=multiprocessing.get_context('spawn'),
+                                                 initializer=init_worker)
+            except (OSError, ValueError, NotImplementedError) as e:
+                print(f"[EXEC] Worker processes unavailable ({e}); running generated code in-process")
+                EXEC_WORKERS = 0
+        return _exec_pool
+
+def execute_code_safely(code, csv_filepath, csv_hash=None):
+    """Safely execute code in a controlled environment (a worker process)"""
+    global _exec_pool, EXEC_WORKERS
+    pool = _get_exec_pool()
+    if pool is None:
+        return execute_code(code, csv_filepath, csv_hash)
     try:
-        # Read CSV file
-        df = pd.read_csv(csv_filepath)
-        
-        # Prepare execution environment
-        import matplotlib
-        matplotlib.use('Agg')  # Use non-interactive backend
-        import matplotlib.pyplot as plt
-        import seaborn as sns
-        
-        exec_globals = {
-            'pd': pd,
-            'np': np,
-            'df': df,
-            'json': json,
-            'plt': plt,
-            'sns': sns,
-            'result': None,
-            'fig': None
-        }
-        
-        # Execute code
-        exec_result = {}
-        exec_locals = {}
-        
-        # Execute code and capture output with timing
-        try:
-            start_time = time.time()
-            exec(code, exec_globals, exec_locals)
-            execution_time = time.time() - start_time
-            
-            # Check result type
-            result = None
-            
-            # Check for chart first
-            if 'fig' in exec_locals and exec_locals['fig'] is not None:
-                # Chart result
-                fig = exec_locals['fig']
-                # Convert chart to base64
-                buf = io.BytesIO()
-                fig.savefig(buf, format='png', bbox_inches='tight', dpi=100)
-                plt.close(fig)  # Close chart to free memory
-                buf.seek(0)
-                img_base64 = base64.b64encode(buf.read()).decode('utf-8')
-                exec_result = {
-                    'type': 'chart',
-                    'data': f'data:image/png;base64,{img_base64}'
-                }
-                return exec_result
-            
-            # Check result variable
-            if 'result' in exec_locals and exec_locals['result'] is not None:
-                result = exec_locals['result']
-            else:
-                # Try to get last expression result
-                result = exec_locals.get('_', None)
-                if result is None:
-                    exec_result = {
-                        'type': 'text',
-                        'data': 'Code executed successfully, but no result returned. Please ensure the code has an explicit return value or assigns to the result variable.'
-                    }
-                    return exec_result
-            
-            # Determine result type
-            if isinstance(result, (int, float, np.number)):
-                exec_result = {
-                    'type': 'number',
-                    'data': float(result)
-                }
-            elif isinstance(result, pd.DataFrame):
-                exec_result = {
-                    'type': 'table',
-                    'data': result.to_dict('records'),
-                    'columns': result.columns.tolist()
-                }
-            elif isinstance(result, pd.Series):
-                exec_result = {
-                    'type': 'table',
-                    'data': result.to_dict(),
-                    'columns': ['Index', 'Value']
-                }
-            else:
-                exec_result = {
-                    'type': 'text',
-                    'data': str(result)
-                }
-            
-            # Add execution time to result
-            if execution_time is not None:
-                exec_result['execution_time'] = execution_time
-            
-            return exec_result
-        except Exception as e:
-            error_result = {
-                'type': 'error',
-                'data': f'Execution error: {str(e)}'
-            }
-            if execution_time is not None:
-                error_result['execution_time'] = execution_time
-            return error_result
-    except Exception as e:
+        future = pool.submit(execute_code, code, csv_filepath, csv_hash)
+    except OSError as e:
+        # Worker processes are started on submit; if that isn't possible, stop trying
+        print(f"[EXEC] Worker processes unavailable ({e}); running generated code in-process")
+        with _exec_pool_lock:
+            EXEC_WORKERS = 0
+            _exec_pool = None
+        pool.shutdown(wait=False)
+        return execute_code(code, csv_filepath, csv_hash)
+    try:
+        return future.result()
+    except BrokenProcessPool as e:
+        # A worker died (e.g. the generated code crashed the interpreter); start a fresh pool next time
+        with _exec_pool_lock:
+            if _exec_pool is pool:
+                _exec_pool = None
+        pool.shutdown(wait=False)
         return {
             'type': 'error',
-            'data': f'Error: {str(e)}'
+            'data': f'Error: execution worker crashed ({e})'
         }
 
 @app.route('/api/models', methods=['GET'])
@@ -437,6 +607,61 @@ def get_available_models():
     ]
     return jsonify(models)
 
+# Metrics are computed off the request path; saves are serialized because the
+# per-session summary totals in evaluation_metrics are shared state
+_metrics_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='metrics')
+_metrics_save_lock = threading.Lock()
+
+def _compute_and_save_metrics(session_id, question, generated_code, execution_result, csv_file,
+                              model, execution_time, recovery_attempts, after_error=False):
+    """Calculate and save evaluation metrics for one answered question (runs on _metrics_executor)"""
+    if session_id not in chat_sessions:
+        return  # Deleted while this task was queued
+    try:
+        if after_error:
+            print(f"[METRICS] Attempting to save metrics after error for session {session_id}")
+        else:
+            print(f"[METRICS] Starting metrics calculation for session {session_id}")
+            print(f"[METRICS] Question: {question[:50]}...")
+            print(f"[METRICS] Model: {model}")
+            print(f"[METRICS] Execution result type: {execution_result.get('type')}")
+        
+        metrics = calculate_evaluation_metrics(
+            question=question,
+            generated_code=generated_code,
+            execution_result=execution_result,
+            csv_file=csv_file,
+            model=model,
+            execution_time=execution_time,
+            recovery_attempts=recovery_attempts
+        )
+        
+        print(f"[METRICS] Metrics calculated successfully. Overall score: {metrics.get('overall_score', 'N/A')}")
+        
+        # Save metrics to file in session directory
+        session_dir = os.path.join('chat_history', session_id)
+        print(f"[METRICS] Saving metrics to {session_dir}")
+        with _metrics_save_lock:
+            # delete_chat drops the session before removing its directory under this lock
+            if session_id not in chat_sessions:
+                print(f"[METRICS] Session {session_id} was deleted; dropping its metrics")
+                return
+            save_evaluation_metrics(session_id, metrics, session_dir=session_dir)
+        print(f"[METRICS] Metrics saved successfully for session {session_id}")
+    except Exception as e:
+        import traceback
+        error_trace = traceback.format_exc()
+        print(f"[METRICS ERROR] Error calculating/saving metrics: {e}")
+        print(f"[METRICS ERROR] Traceback: {error_trace}")
+
+def _submit_metrics(*args, **kwargs):
+    """Queue metrics calculation; failures are logged and never fail the request"""
+    try:
+        _metrics_executor.submit(_compute_and_save_metrics, *args, **kwargs)
+    except RuntimeError as e:
+        # Executor already shut down (interpreter exiting)
+        print(f"[METRICS ERROR] Could not queue metrics calculation: {e}")
+
 @app.route('/api/message', methods=['POST'])
 def send_message():
     """Process user message and return AI response"""
@@ -498,17 +723,19 @@ def send_message():
     
     try:
         # Get CSV information
-        df = pd.read_csv(csv_file)
-        csv_info = {
-            'columns': df.columns.tolist(),
-            'dtypes': df.dtypes.astype(str).to_dict()
-        }
+        csv_hash = chat_sessions[session_id].get('csv_hash')
+        csv_info = _csv_info(csv_hash, csv_file)
         
-        # Generate Pandas code
-        generated_code = generate_pandas_code(question, csv_info, model=selected_model)
+        # Generate Pandas code (reusing cached code for the same or a similar question on this CSV)
+        system_prompt = _build_system_prompt(csv_info)
+        cached_code = llm_cache.get(question, selected_model, csv_hash, system_prompt) if csv_hash else None
+        if cached_code is not None:
+            generated_code = cached_code
+        else:
+            generated_code = generate_pandas_code(question, csv_info, model=selected_model)
         
         # Execute code and measure execution time
-        execution_result = execute_code_safely(generated_code, csv_file)
+        execution_result = execute_code_safely(generated_code, csv_file, csv_hash)
         execution_time = execution_result.get('execution_time')
         
         # Track recovery attempts if execution failed
@@ -517,10 +744,8 @@ def send_message():
         # If execution failed, attempt to recover
         if execution_result.get('type') == 'error' and max_recovery_attempts > 0:
             error_message = execution_result.get('data', '')
-            for attempt_num in range(max_recovery_attempts):
-                try:
-                    # Generate recovery prompt
-                    recovery_prompt = f"""The previous code failed with error: {error_message}
+            # Generate recovery prompt
+            recovery_prompt = f"""The previous code failed with error: {error_message}
 
 Original question: {question}
 Original code:
@@ -529,12 +754,18 @@ Original code:
 ```
 
 Please fix the code to resolve the error. Return only the corrected Python code."""
-                    
-                    # Generate fixed code
-                    fixed_code = generate_pandas_code(recovery_prompt, csv_info, model=selected_model)
+            
+            # Every attempt uses the same prompt, so generate all candidates concurrently,
+            # then execute them in order and stop at the first that succeeds
+            candidates = run_coroutine(_agenerate_candidates(recovery_prompt, csv_info, selected_model,
+                                                             max_recovery_attempts))
+            for attempt_num, fixed_code in enumerate(candidates):
+                try:
+                    if isinstance(fixed_code, Exception):
+                        raise fixed_code
                     
                     # Execute fixed code
-                    fixed_result = execute_code_safely(fixed_code, csv_file)
+                    fixed_result = execute_code_safely(fixed_code, csv_file, csv_hash)
                     fixed_execution_time = fixed_result.get('execution_time')
                     
                     # Record recovery attempt
@@ -563,36 +794,13 @@ Please fix the code to resolve the error. Return only the corrected Python code.
                         'execution_time': None
                     })
         
-        # Calculate evaluation metrics (runs in background, doesn't block response)
-        try:
-            print(f"[METRICS] Starting metrics calculation for session {session_id}")
-            print(f"[METRICS] Question: {question[:50]}...")
-            print(f"[METRICS] Model: {selected_model}")
-            print(f"[METRICS] Execution result type: {execution_result.get('type')}")
-            
-            metrics = calculate_evaluation_metrics(
-                question=question,
-                generated_code=generated_code,
-                execution_result=execution_result,
-                csv_file=csv_file,
-                model=selected_model,
-                execution_time=execution_time,
-                recovery_attempts=recovery_attempts
-            )
-            
-            print(f"[METRICS] Metrics calculated successfully. Overall score: {metrics.get('overall_score', 'N/A')}")
-            
-            # Save metrics to file in session directory (background operation)
-            session_dir = os.path.join('chat_history', session_id)
-            print(f"[METRICS] Saving metrics to {session_dir}")
-            save_evaluation_metrics(session_id, metrics, session_dir=session_dir)
-            print(f"[METRICS] Metrics saved successfully for session {session_id}")
-        except Exception as e:
-            import traceback
-            error_trace = traceback.format_exc()
-            print(f"[METRICS ERROR] Error calculating/saving metrics: {e}")
-            print(f"[METRICS ERROR] Traceback: {error_trace}")
-            # Don't fail the request if metrics calculation fails
+        # Cache code that ran successfully (never failing code)
+        if csv_hash and execution_result.get('type') != 'error' and generated_code != cached_code:
+            llm_cache.put(question, selected_model, csv_hash, system_prompt, generated_code)
+        
+        # Calculate evaluation metrics in the background (doesn't block the response)
+        _submit_metrics(session_id, question, generated_code, execution_result, csv_file,
+                        selected_model, execution_time, recovery_attempts)
         
         # Record history (ensure history key exists)
         if 'history' not in chat_sessions[session_id]:
@@ -644,23 +852,10 @@ Please fix the code to resolve the error. Return only the corrected Python code.
             'data': f'Error processing request: {str(e)}'
         }
         
-        # Still try to calculate metrics even if there was an error
-        try:
-            print(f"[METRICS] Attempting to save metrics after error for session {session_id}")
-            metrics = calculate_evaluation_metrics(
-                question=question,
-                generated_code=generated_code if generated_code else "",
-                execution_result=execution_result,
-                csv_file=csv_file if csv_file else "",
-                model=selected_model,
-                execution_time=execution_time,
-                recovery_attempts=recovery_attempts
-            )
-            session_dir = os.path.join('chat_history', session_id)
-            save_evaluation_metrics(session_id, metrics, session_dir=session_dir)
-            print(f"[METRICS] Metrics saved after error for session {session_id}")
-        except Exception as metrics_error:
-            print(f"[METRICS ERROR] Failed to save metrics after error: {metrics_error}")
+        # Still calculate metrics even if there was an error
+        _submit_metrics(session_id, question, generated_code if generated_code else "", execution_result,
+                        csv_file if csv_file else "", selected_model, execution_time, recovery_attempts,
+                        after_error=True)
         
         # Ensure history key exists
         if 'history' not in chat_sessions[session_id]:
@@ -692,24 +887,170 @@ def open_browser():
         webbrowser.open('http://127.0.0.1:5000')
         _browser_opened = True
 
+def _unpersisted(pushed, name, items):
+    """
+    Snapshot a session list and find the items not yet persisted.
+    Returns (snapshot, start, replaced); replaced means the list object changed (e.g. history
+    reset on a new upload) and must be rewritten. Callers record (items, len(snapshot)) in
+    pushed once the write succeeds.
+    """
+    # Request threads append concurrently; everything below works from one copy
+    snapshot = list(items)
+    persisted_list, start = pushed.get(name, (None, 0))
+    replaced = persisted_list is not None and persisted_list is not items
+    return (snapshot, 0, True) if replaced or start > len(snapshot) else (snapshot, start, False)
+
+def _save_chat_session_redis(session_id):
+    """Write session metadata with SET and RPUSH only the messages/history added since the last save"""
+    session_data = dict(chat_sessions[session_id])
+    pushed = _persisted_lengths.setdefault(session_id, {})
+    meta = {k: v for k, v in session_data.items() if k not in _SESSION_LISTS}
+    
+    pipe = redis_client.pipeline()
+    pipe.set(f"session:{session_id}", _json_dumps(meta))
+    written = []
+    for name in _SESSION_LISTS:
+        items = session_data.get(name, [])
+        list_key = f"session:{session_id}:{name}"
+        snapshot, start, replaced = _unpersisted(pushed, name, items)
+        if replaced:
+            pipe.delete(list_key)
+        if len(snapshot) > start:
+            pipe.rpush(list_key, *[_json_dumps(item) for item in snapshot[start:]])
+        written.append((name, items, snapshot))
+    pipe.execute()
+    for name, items, snapshot in written:
+        pushed[name] = (items, len(snapshot))
+
+def _save_chat_session_file(session_id, session_dir):
+    """Rewrite session.json only when metadata changed and append new messages/history to JSONL files"""
+    session_data = dict(chat_sessions[session_id])
+    pushed = _persisted_lengths.setdefault(session_id, {})
+    for name in _SESSION_LISTS:
+        items = session_data.get(name, [])
+        snapshot, start, replaced = _unpersisted(pushed, name, items)
+        if len(snapshot) > start or replaced:
+            with open(os.path.join(session_dir, f'{name}.jsonl'), 'wb' if replaced else 'ab') as f:
+                f.write(b''.join(_json_dumps(item) + b'\n' for item in snapshot[start:]))
+        pushed[name] = (items, len(snapshot))
+    
+    meta = _json_dumps({k: v for k, v in session_data.items() if k not in _SESSION_LISTS}, indent=True)
+    if _persisted_meta.get(session_id) != meta:
+        session_file = os.path.join(session_dir, 'session.json')
+        with open(session_file + '.tmp', 'wb') as f:
+            f.write(meta)
+        os.replace(session_file + '.tmp', session_file)
+        _persisted_meta[session_id] = meta
+
+def _write_chat_session(session_id):
+    """Write one session to Redis (when REDIS_URL is set) or to file"""
+    with _session_write_lock:
+        if session_id not in chat_sessions:
+            return
+        try:
+            if redis_client is not None:
+                _save_chat_session_redis(session_id)
+                return
+            
+            session_dir = os.path.join('chat_history', session_id)
+            os.makedirs(session_dir, exist_ok=True)
+            _save_chat_session_file(session_id, session_dir)
+        except Exception as e:
+            print(f"Error saving session {session_id}: {e}")
+            # Keep it dirty so the next pass retries
+            with _dirty_lock:
+                _dirty.add(session_id)
+
+def flush_chat_sessions():
+    """Write every dirty session now"""
+    with _dirty_lock:
+        pending = list(_dirty)
+        _dirty.clear()
+    for session_id in pending:
+        _write_chat_session(session_id)
+
+def _session_writer_loop():
+    while True:
+        time.sleep(_SESSION_WRITE_INTERVAL)
+        flush_chat_sessions()
+
 def save_chat_session(session_id):
-    """Save chat session to file"""
+    """Mark a chat session for saving; the background writer persists it within _SESSION_WRITE_INTERVAL"""
+    global _session_writer
     if session_id not in chat_sessions:
         return
     
-    try:
-        session_dir = os.path.join('chat_history', session_id)
-        os.makedirs(session_dir, exist_ok=True)
-        
-        session_file = os.path.join(session_dir, 'session.json')
-        with open(session_file, 'w', encoding='utf-8') as f:
-            json.dump(chat_sessions[session_id], f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        print(f"Error saving session {session_id}: {e}")
+    with _dirty_lock:
+        _dirty.add(session_id)
+        # Started on first use rather than at import, so importing frontend starts no threads
+        if _session_writer is None:
+            _session_writer = threading.Thread(target=_session_writer_loop, daemon=True)
+            _session_writer.start()
+
+if not _IN_EXEC_WORKER:
+    atexit.register(flush_chat_sessions)
+
+def _delete_chat_session_redis(session_id):
+    """Remove a session's keys from Redis"""
+    redis_client.delete(f"session:{session_id}", *[f"session:{session_id}:{name}" for name in _SESSION_LISTS])
+
+def _load_chat_sessions_from_redis():
+    """Load chat sessions from Redis (metadata keys are session:{id}, lists session:{id}:{name})"""
+    for key in redis_client.scan_iter(match='session:*'):
+        key = key.decode('utf-8')
+        session_id = key[len('session:'):]
+        if ':' in session_id:
+            continue
+        try:
+            pipe = redis_client.pipeline()
+            pipe.get(key)
+            for name in _SESSION_LISTS:
+                pipe.lrange(f"{key}:{name}", 0, -1)
+            meta, *lists = pipe.execute()
+            if meta is None:
+                continue
+            session_data = _json_loads(meta)
+            for name, items in zip(_SESSION_LISTS, lists):
+                session_data[name] = [_json_loads(item) for item in items]
+            if 'csv_file' not in session_data:
+                session_data['csv_file'] = None
+            if 'csv_hash' not in session_data:
+                session_data['csv_hash'] = None
+            chat_sessions[session_id] = session_data
+            _persisted_lengths[session_id] = {name: (session_data[name], len(session_data[name])) for name in _SESSION_LISTS}
+        except Exception as e:
+            print(f"Error loading session {session_id}: {e}")
+
+def _read_session_log(log_file):
+    """
+    Read a messages/history JSONL log. Every record is written with its newline, so bytes after
+    the last newline are a torn append (e.g. a crash mid-write); they are cut off so the next
+    append starts on a fresh line. Unreadable lines are skipped like in load_metrics.
+    """
+    with open(log_file, 'rb') as f:
+        data = f.read()
+    end = data.rfind(b'\n') + 1
+    if end < len(data):
+        print(f"Warning: Dropping an incomplete last line of {log_file}")
+        with open(log_file, 'r+b') as f:
+            f.truncate(end)
+    items = []
+    for line in data[:end].splitlines():
+        if not line.strip():
+            continue
+        try:
+            items.append(_json_loads(line))
+        except ValueError as e:
+            print(f"Warning: Skipping unreadable line of {log_file}: {e}")
+    return items
 
 def load_chat_sessions_from_disk():
-    """Load chat sessions from disk"""
+    """Load chat sessions from disk (or from Redis when REDIS_URL is set)"""
     global chat_sessions
+    if redis_client is not None:
+        _load_chat_sessions_from_redis()
+        return
+    
     if not os.path.exists('chat_history'):
         return
     
@@ -719,16 +1060,24 @@ def load_chat_sessions_from_disk():
             session_file = os.path.join(session_dir, 'session.json')
             if os.path.exists(session_file):
                 try:
-                    with open(session_file, 'r', encoding='utf-8') as f:
-                        session_data = json.load(f)
-                    # Ensure all required keys exist
-                    if 'history' not in session_data:
-                        session_data['history'] = []
+                    with open(session_file, 'rb') as f:
+                        session_data = _json_loads(f.read())
+                    # Older sessions keep messages/history inline in session.json; those are
+                    # moved to the JSONL files on their next save
+                    legacy = any(name in session_data for name in _SESSION_LISTS)
+                    for name in _SESSION_LISTS:
+                        log_file = os.path.join(session_dir, f'{name}.jsonl')
+                        if os.path.exists(log_file):
+                            session_data[name] = _read_session_log(log_file)
+                        elif name not in session_data:
+                            session_data[name] = []
                     if 'csv_file' not in session_data:
                         session_data['csv_file'] = None
                     if 'csv_hash' not in session_data:
                         session_data['csv_hash'] = None
                     chat_sessions[session_id] = session_data
+                    if not legacy:
+                        _persisted_lengths[session_id] = {name: (session_data[name], len(session_data[name])) for name in _SESSION_LISTS}
                 except Exception as e:
                     print(f"Error loading session {session_id}: {e}")
 
@@ -0,0 +1,26 @@
+"""
+Gunicorn configuration for serving frontend.py in production
+Run: gunicorn -c gunicorn_conf.py frontend:app
+"""
+import os
+
+bind = os.getenv('BIND', '127.0.0.1:5000')
+
+# Threaded workers: LLM calls already run on an asyncio loop thread and generated code in a
+# process pool, neither of which works under gevent's monkey-patching
+worker_class = 'gthread'
+threads = int(os.getenv('WEB_THREADS', '16'))
+
+# Chat sessions are held in each worker's memory, so more than one worker only sees a
+# consistent view when they are shared through Redis (REDIS_URL)
+workers = int(os.getenv('WEB_WORKERS', str(os.cpu_count() or 1) if os.getenv('REDIS_URL') else '1'))
+
+# Generation plus recovery attempts can take a while
+timeout = 120
+graceful_timeout = 30
+
+def post_worker_init(worker):
+    """Load saved chat sessions in each worker once the app is imported"""
+    from frontend import chat_sessions, load_chat_sessions_from_disk
+    load_chat_sessions_from_disk()
+    worker.log.info(f"Loaded {len(chat_sessions)} chat sessions")
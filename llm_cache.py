@@ -0,0 +1,196 @@
+"""
+LLM Response Cache
+Two-tier cache for generated code: exact match on (model, CSV, prompt, question),
+then semantic match on question embeddings within the same model and CSV
+"""
+import hashlib
+import importlib.util
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+# Numbers must match exactly for a semantic hit ("older than 30" vs "older than 40")
+_NUMBER_RE = re.compile(r'\d+(?:\.\d+)?')
+
+def sentence_transformer_embedder(model_name: str = 'all-MiniLM-L6-v2') -> Optional[Callable]:
+    """embed_fn backed by a local sentence-transformers model (loaded on first use),
+    or None when sentence-transformers is not installed"""
+    if importlib.util.find_spec('sentence_transformers') is None:
+        return None
+    model = None
+    lock = threading.Lock()
+
+    def embed(texts: List[str]):
+        nonlocal model
+        with lock:
+            if model is None:
+                from sentence_transformers import SentenceTransformer
+                model = SentenceTransformer(model_name)
+        return model.encode(texts, normalize_embeddings=True)
+    return embed
+
+class LLMCache:
+    """Exact + semantic cache of generated code, persisted under cache_dir"""
+
+    def __init__(self, cache_dir: str = os.path.join('.cache', 'llm_cache'),
+                 embed_fn: Optional[Callable[[List[str]], List[List[float]]]] = None,
+                 threshold: float = 0.92, max_entries: int = 1000):
+        self.cache_dir = cache_dir
+        self.embed_fn = embed_fn
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # key -> {'bucket', 'question', 'code'}, oldest first
+        self._entries: OrderedDict = OrderedDict()
+        # key -> normalized question embedding (numpy vector)
+        self._embeddings: Dict = {}
+        # bucket -> (keys, matrix of their embeddings), rebuilt lazily after changes
+        self._index: Dict = {}
+        self._embed_memo: OrderedDict = OrderedDict()
+        self._load()
+
+    @staticmethod
+    def _bucket(model: str, csv_hash: str, system_prompt: str) -> str:
+        return hashlib.sha256(f"{model}\0{csv_hash}\0{system_prompt}".encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _key(bucket: str, question: str) -> str:
+        return hashlib.sha256(f"{bucket}\0{question}".encode('utf-8')).hexdigest()
+
+    def _embed(self, question: str):
+        """Normalized embedding of a question (memoized, None if embedding fails)"""
+        import numpy as np
+
+        with self._lock:
+            vec = self._embed_memo.get(question)
+        if vec is not None:
+            return vec
+        try:
+            vec = np.asarray(self.embed_fn([question])[0], dtype=np.float32)
+        except Exception as e:
+            print(f"[LLM_CACHE] Embedding failed: {e}")
+            return None
+        norm = np.linalg.norm(vec)
+        if norm > 0:
+            vec = vec / norm
+        with self._lock:
+            self._embed_memo[question] = vec
+            if len(self._embed_memo) > 256:
+                self._embed_memo.popitem(last=False)
+        return vec
+
+    def _bucket_index(self, bucket: str):
+        """Keys and stacked embeddings of a bucket's entries"""
+        import numpy as np
+
+        index = self._index.get(bucket)
+        if index is None:
+            keys = [k for k, e in self._entries.items() if e['bucket'] == bucket and k in self._embeddings]
+            matrix = np.stack([self._embeddings[k] for k in keys]) if keys else None
+            index = self._index[bucket] = (keys, matrix)
+        return index
+
+    def get(self, question: str, model: str, csv_hash: str, system_prompt: str) -> Optional[str]:
+        """Return cached code for a question, or None on a miss"""
+        bucket = self._bucket(model, csv_hash, system_prompt)
+        key = self._key(bucket, question)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                print("[LLM_CACHE] Exact hit")
+                return entry['code']
+            if self.embed_fn is None:
+                return None
+            keys, matrix = self._bucket_index(bucket)
+        if matrix is None:
+            return None
+
+        vec = self._embed(question)
+        # Embeddings from another embedder (e.g. persisted before switching models) can't be compared
+        if vec is None or matrix.shape[1] != len(vec):
+            return None
+        similarities = matrix @ vec
+        numbers = _NUMBER_RE.findall(question)
+        with self._lock:
+            for i in similarities.argsort()[::-1]:
+                if similarities[i] < self.threshold:
+                    break
+                entry = self._entries.get(keys[i])
+                if entry is not None and _NUMBER_RE.findall(entry['question']) == numbers:
+                    print(f"[LLM_CACHE] Semantic hit (similarity {similarities[i]:.3f})")
+                    return entry['code']
+        return None
+
+    def put(self, question: str, model: str, csv_hash: str, system_prompt: str, code: str):
+        """Store code that answered a question (callers should only store code that ran successfully)"""
+        bucket = self._bucket(model, csv_hash, system_prompt)
+        key = self._key(bucket, question)
+        vec = self._embed(question) if self.embed_fn is not None else None
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = {'bucket': bucket, 'question': question, 'code': code}
+            if vec is not None:
+                if self._embeddings and len(next(iter(self._embeddings.values()))) != len(vec):
+                    # The embedder changed; keep the entries for exact hits but drop stale vectors
+                    self._embeddings.clear()
+                    self._index.clear()
+                self._embeddings[key] = vec
+            while len(self._entries) > self.max_entries:
+                old_key, old = self._entries.popitem(last=False)
+                self._embeddings.pop(old_key, None)
+                self._index.pop(old['bucket'], None)
+            self._index.pop(bucket, None)
+            self._save()
+
+    def _save(self):
+        """Write entries (JSON) and embeddings (.npy rows aligned with entries) atomically"""
+        import numpy as np
+
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            keys = list(self._entries)
+            entries_file = os.path.join(self.cache_dir, 'entries.json')
+            with open(entries_file + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump([dict(self._entries[k], key=k, has_embedding=k in self._embeddings) for k in keys],
+                          f, ensure_ascii=False)
+            if self._embeddings:
+                dim = len(next(iter(self._embeddings.values())))
+                matrix = np.zeros((len(keys), dim), dtype=np.float32)
+                for i, k in enumerate(keys):
+                    if k in self._embeddings:
+                        matrix[i] = self._embeddings[k]
+                embeddings_file = os.path.join(self.cache_dir, 'embeddings.npy')
+                with open(embeddings_file + '.tmp', 'wb') as f:
+                    np.save(f, matrix)
+                os.replace(embeddings_file + '.tmp', embeddings_file)
+            os.replace(entries_file + '.tmp', entries_file)
+        except Exception as e:
+            print(f"[LLM_CACHE] Error saving cache: {e}")
+
+    def _load(self):
+        import numpy as np
+
+        entries_file = os.path.join(self.cache_dir, 'entries.json')
+        if not os.path.exists(entries_file):
+            return
+        try:
+            with open(entries_file, 'r', encoding='utf-8') as f:
+                stored = json.load(f)
+            matrix = None
+            embeddings_file = os.path.join(self.cache_dir, 'embeddings.npy')
+            if os.path.exists(embeddings_file):
+                matrix = np.load(embeddings_file)
+                if len(matrix) != len(stored):
+                    matrix = None
+            for i, e in enumerate(stored):
+                key = e['key']
+                self._entries[key] = {'bucket': e['bucket'], 'question': e['question'], 'code': e['code']}
+                if matrix is not None and e.get('has_embedding'):
+                    self._embeddings[key] = matrix[i]
+        except Exception as e:
+            print(f"[LLM_CACHE] Could not load cache, starting empty: {e}")
+            self._entries.clear()
+            self._embeddings.clear()
@@ -0,0 +1,24 @@
+"""
+Shared background event loop for async LLM calls
+Async clients keep their connection pools bound to one loop, so every coroutine runs on this loop
+"""
+import asyncio
+import threading
+
+_loop = None
+_loop_lock = threading.Lock()
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """Return the background event loop, starting its thread on first use"""
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name='llm-event-loop', daemon=True).start()
+                _loop = loop
+    return _loop
+
+def run_coroutine(coro):
+    """Run a coroutine on the background loop and block until it returns (from sync code)"""
+    return asyncio.run_coroutine_threadsafe(coro, get_loop()).result()
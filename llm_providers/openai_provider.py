@@ -2,49 +2,142 @@
 OpenAI Provider
 Direct OpenAI API integration for GPT-4
 """
-from openai import OpenAI
-from typing import Dict, Optional
+import json
+from typing import Dict, List, Optional
+
+from .rate_limiter import estimate_tokens, limiter_for
 
 class OpenAIProvider:
     """OpenAI provider for direct API access"""
     
     def __init__(self, api_key: str):
         self.api_key = api_key
+        # Imported on first use so importing this module doesn't load the SDK (or httpx)
+        import httpx
+        from openai import OpenAI, AsyncOpenAI
+        
+        self._httpx = httpx
         self.client = OpenAI(api_key=api_key)
+        self.aclient = AsyncOpenAI(api_key=api_key)
         self.current_model = None
     
+    def _build_messages(self, system_prompt: str, user_prompt: str) -> list:
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+    
+    def _read_response(self, response) -> str:
+        """Extract the generated code and record token usage"""
+        code = response.choices[0].message.content.strip()
+        
+        # Track token usage
+        if hasattr(response, 'usage'):
+            self.last_usage = {
+                'prompt_tokens': response.usage.prompt_tokens,
+                'completion_tokens': response.usage.completion_tokens,
+                'total_tokens': response.usage.total_tokens
+            }
+        else:
+            self.last_usage = None
+        
+        return code
+    
     def generate_code(self, system_prompt: str, user_prompt: str, 
                      model: str = "gpt-4", temperature: float = 0.3, 
-                     max_tokens: int = 1000) -> str:
-        """Generate code using OpenAI API"""
+                     max_tokens: int = 1000, system_prefix: Optional[str] = None) -> str:
+        """Generate code using OpenAI API
+        OpenAI caches repeated prompt prefixes on its own; system_prefix is accepted so both
+        providers share one call signature"""
         self.current_model = model
         
         try:
-            response = self.client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=temperature,
-                max_tokens=max_tokens
-            )
-            code = response.choices[0].message.content.strip()
-            
-            # Track token usage
-            if hasattr(response, 'usage'):
-                self.last_usage = {
-                    'prompt_tokens': response.usage.prompt_tokens,
-                    'completion_tokens': response.usage.completion_tokens,
-                    'total_tokens': response.usage.total_tokens
-                }
-            else:
-                self.last_usage = None
-            
-            return code
+            # Wait for the model's request/token budget instead of running into 429s
+            tokens = estimate_tokens(model, system_prompt + user_prompt, max_tokens)
+            with limiter_for(model).reserve(tokens):
+                response = self.client.chat.completions.create(
+                    model=model,
+                    messages=self._build_messages(system_prompt, user_prompt),
+                    temperature=temperature,
+                    max_tokens=max_tokens
+                )
+            return self._read_response(response)
         except Exception as e:
             raise Exception(f"Error generating code with {model}: {str(e)}")
     
+    async def agenerate_code(self, system_prompt: str, user_prompt: str, 
+                             model: str = "gpt-4", temperature: float = 0.3, 
+                             max_tokens: int = 1000, system_prefix: Optional[str] = None) -> str:
+        """Generate code using OpenAI API without blocking (run on llm_providers.event_loop)"""
+        self.current_model = model
+        
+        try:
+            tokens = estimate_tokens(model, system_prompt + user_prompt, max_tokens)
+            async with limiter_for(model).reserve(tokens):
+                response = await self.aclient.chat.completions.create(
+                    model=model,
+                    messages=self._build_messages(system_prompt, user_prompt),
+                    temperature=temperature,
+                    max_tokens=max_tokens
+                )
+            return self._read_response(response)
+        except Exception as e:
+            raise Exception(f"Error generating code with {model}: {str(e)}")
+    
+    def submit_batch(self, requests: List[Dict], completion_window: str = "24h") -> str:
+        """Submit generate_code requests (dicts of its keyword arguments) to the Batch API for offline runs
+        (half the token price, results within completion_window); returns the batch id for poll_batch"""
+        lines = []
+        for i, request in enumerate(requests):
+            body = {
+                'model': request.get('model', 'gpt-4'),
+                'messages': self._build_messages(request['system_prompt'], request['user_prompt']),
+                'temperature': request.get('temperature', 0.3),
+                'max_tokens': request.get('max_tokens', 1000)
+            }
+            lines.append(json.dumps({'custom_id': str(i), 'method': 'POST',
+                                     'url': '/v1/chat/completions', 'body': body}))
+        upload = self.client.files.create(file=('batch.jsonl', '\n'.join(lines).encode('utf-8')), purpose='batch')
+        
+        # The pinned SDK has no batches resource, so the endpoint is called through the client directly
+        response = self.client.post('/batches', cast_to=self._httpx.Response, body={
+            'input_file_id': upload.id,
+            'endpoint': '/v1/chat/completions',
+            'completion_window': completion_window
+        })
+        return response.json()['id']
+    
+    def poll_batch(self, batch_id: str) -> Optional[List]:
+        """Generated code of a finished batch in submission order, or None while it is still running;
+        requests that failed yield an Exception in their place"""
+        batch = self.client.get(f'/batches/{batch_id}', cast_to=self._httpx.Response).json()
+        status = batch['status']
+        if status in ('failed', 'expired', 'cancelled'):
+            raise Exception(f"Batch {batch_id} {status}")
+        if status != 'completed':
+            return None
+        
+        results = [None] * batch['request_counts']['total']
+        for file_id in (batch.get('output_file_id'), batch.get('error_file_id')):
+            if not file_id:
+                continue
+            for line in self.client.files.content(file_id).text.splitlines():
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                response = record.get('response') or {}
+                if response.get('status_code') == 200:
+                    code = response['body']['choices'][0]['message']['content'].strip()
+                else:
+                    code = Exception(f"Batch request failed: {record.get('error') or response.get('body')}")
+                results[int(record['custom_id'])] = code
+        return [Exception("No result returned") if code is None else code for code in results]
+    
+    def embed(self, texts: List[str], model: str = "text-embedding-3-small") -> List[List[float]]:
+        """Embed texts (used by the semantic response cache)"""
+        response = self.client.embeddings.create(model=model, input=texts)
+        return [item.embedding for item in response.data]
+    
     def get_model_name(self) -> str:
         """Get current model name"""
         return self.current_model or "unknown"
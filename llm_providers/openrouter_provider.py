@@ -2,61 +2,374 @@
 OpenRouter LLM Provider
 Supports multiple models through OpenRouter API
 """
-from openai import OpenAI
+import asyncio
+import hashlib
+import importlib.util
+import json
 import os
-from typing import Dict, Optional
+import time
+from typing import Dict, Iterator, List, Optional
+
+from .event_loop import run_coroutine
+from .rate_limiter import estimate_tokens, limiter_for
+
+# Keep-alive pools shared by every call of a provider; HTTP/2 when the h2 package is installed
+_HTTP_MAX_KEEPALIVE = 20
+_HTTP_MAX_CONNECTIONS = 100
+_HTTP_TIMEOUT = 600.0
+_HTTP_CONNECT_TIMEOUT = 5.0  # the openai SDK's defaults
+_HTTP2 = importlib.util.find_spec('h2') is not None
+
+# Appended to the system prompt when several questions are packed into one completion
+_BATCH_INSTRUCTIONS = """
+
+You will receive several numbered questions. Answer each one independently, following the rules above.
+Reply with only a JSON object of the form {"answers": ["<code for question 1>", "<code for question 2>", ...]}
+holding exactly one code string per question, in order."""
+
+# Upstream providers that honour cache_control breakpoints on OpenRouter (others cache
+# automatically or not at all, and get plain string messages)
+_CACHE_CONTROL_PREFIXES = ('anthropic/', 'google/')
 
 class OpenRouterProvider:
     """OpenRouter provider for multiple LLM models"""
     
-    def __init__(self, api_key: str, base_url: str = "https://openrouter.ai/api/v1"):
+    def __init__(self, api_key: str, base_url: str = "https://openrouter.ai/api/v1",
+                 cache_dir: str = os.path.join('.cache', 'openrouter'), ttl_seconds: Optional[float] = None):
         self.api_key = api_key
         self.base_url = base_url
+        # Responses cached on disk, one JSON file per request (ttl_seconds=None never expires)
+        self.cache_dir = cache_dir
+        self.ttl_seconds = ttl_seconds
         
         # OpenRouter requires additional headers
         # Create client with default headers
-        self.client = OpenAI(
-            base_url=base_url,
-            api_key=api_key,
-            default_headers={
-                "HTTP-Referer": "https://github.com/yourusername/ise547project",  # Optional: Your app URL
-                "X-Title": "Chat with Your Data"  # Optional: Your app name
-            }
-        )
+        default_headers = {
+            "HTTP-Referer": "https://github.com/yourusername/ise547project",  # Optional: Your app URL
+            "X-Title": "Chat with Your Data"  # Optional: Your app name
+        }
+        # The SDK (and httpx, pydantic) is imported here rather than at module level, so importing
+        # this module stays cheap for code that never creates a provider
+        import httpx
+        from openai import OpenAI, AsyncOpenAI
+        
+        limits = httpx.Limits(max_keepalive_connections=_HTTP_MAX_KEEPALIVE, max_connections=_HTTP_MAX_CONNECTIONS)
+        timeout = httpx.Timeout(_HTTP_TIMEOUT, connect=_HTTP_CONNECT_TIMEOUT)
+        self._http = httpx.Client(http2=_HTTP2, limits=limits, timeout=timeout)
+        self._ahttp = httpx.AsyncClient(http2=_HTTP2, limits=limits, timeout=timeout)
+        self.client = OpenAI(base_url=base_url, api_key=api_key, default_headers=default_headers,
+                             http_client=self._http)
+        self.aclient = AsyncOpenAI(base_url=base_url, api_key=api_key, default_headers=default_headers,
+                                   http_client=self._ahttp)
         self.current_model = None
+        # request key -> task of the identical request already in flight (on the shared event loop)
+        self._inflight: Dict[str, asyncio.Task] = {}
+    
+    @staticmethod
+    def _request_key(system_prompt: str, user_prompt: str, model: str,
+                     temperature: float, max_tokens: int) -> str:
+        request = {'model': model, 'temperature': temperature, 'max_tokens': max_tokens,
+                   'system_prompt': system_prompt, 'user_prompt': user_prompt}
+        return hashlib.sha256(json.dumps(request, sort_keys=True).encode('utf-8')).hexdigest()
+    
+    def _cache_path(self, system_prompt: str, user_prompt: str, model: str,
+                    temperature: float, max_tokens: int) -> str:
+        key = self._request_key(system_prompt, user_prompt, model, temperature, max_tokens)
+        return os.path.join(self.cache_dir, f"{key}.json")
+    
+    def _read_cache(self, path: str) -> Optional[Dict]:
+        """Cached response at path, or None if missing, expired or unreadable"""
+        try:
+            if self.ttl_seconds is not None and time.time() - os.path.getmtime(path) > self.ttl_seconds:
+                return None
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+    
+    def _write_cache(self, path: str, code: str):
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump({'code': code, 'usage': self.last_usage}, f, ensure_ascii=False)
+            os.replace(path + '.tmp', path)
+        except OSError as e:
+            print(f"Warning: could not write OpenRouter cache: {e}")
+    
+    def _build_messages(self, system_prompt: str, user_prompt: str, model: str = "",
+                        system_prefix: Optional[str] = None) -> list:
+        """Chat messages; when system_prompt starts with the static system_prefix and the model supports it,
+        the prefix is sent as its own content part marked for provider-side prompt caching"""
+        if (system_prefix and system_prompt.startswith(system_prefix)
+                and model.startswith(_CACHE_CONTROL_PREFIXES)):
+            system_content = [
+                {"type": "text", "text": system_prefix, "cache_control": {"type": "ephemeral"}},
+                {"type": "text", "text": system_prompt[len(system_prefix):]}
+            ]
+        else:
+            system_content = system_prompt
+        return [
+            {"role": "system", "content": system_content},
+            {"role": "user", "content": user_prompt}
+        ]
+    
+    def _read_response(self, response) -> str:
+        """Extract the generated code and record token usage"""
+        code = response.choices[0].message.content.strip()
+        
+        # Track token usage for cost estimation
+        if hasattr(response, 'usage'):
+            self.last_usage = {
+                'prompt_tokens': response.usage.prompt_tokens,
+                'completion_tokens': response.usage.completion_tokens,
+                'total_tokens': response.usage.total_tokens
+            }
+        else:
+            self.last_usage = None
+        
+        return code
+    
+    def _cached(self, system_prompt: str, user_prompt: str, model: str, temperature: float,
+                max_tokens: int, use_cache: Optional[bool]):
+        """(cache path or None, cached code or None) for a request"""
+        if use_cache is None:
+            use_cache = temperature == 0
+        if not use_cache:
+            return None, None
+        cache_path = self._cache_path(system_prompt, user_prompt, model, temperature, max_tokens)
+        cached = self._read_cache(cache_path)
+        if cached is None:
+            return cache_path, None
+        self.last_usage = cached.get('usage')
+        return cache_path, cached['code']
     
     def generate_code(self, system_prompt: str, user_prompt: str, 
                      model: str, temperature: float = 0.3, 
-                     max_tokens: int = 1000) -> str:
-        """Generate code using specified model"""
+                     max_tokens: int = 1000, use_cache: Optional[bool] = None,
+                     system_prefix: Optional[str] = None) -> str:
+        """Generate code using specified model
+        Responses are served from the disk cache when use_cache is True, or by default when
+        temperature is 0 (sampled outputs are not cached unless asked for); system_prefix marks
+        the static start of system_prompt for provider-side prompt caching"""
+        self.current_model = model
+        cache_path, cached = self._cached(system_prompt, user_prompt, model, temperature, max_tokens, use_cache)
+        if cached is not None:
+            return cached
+        
+        try:
+            # Wait for the model's request/token budget instead of running into 429s
+            tokens = estimate_tokens(model, system_prompt + user_prompt, max_tokens)
+            with limiter_for(model).reserve(tokens):
+                response = self.client.chat.completions.create(
+                    model=model,
+                    messages=self._build_messages(system_prompt, user_prompt, model, system_prefix),
+                    temperature=temperature,
+                    max_tokens=max_tokens
+                )
+            code = self._read_response(response)
+            if cache_path is not None:
+                self._write_cache(cache_path, code)
+            return code
+        except Exception as e:
+            raise Exception(f"Error generating code with {model}: {str(e)}")
+    
+    def stream_code(self, system_prompt: str, user_prompt: str,
+                    model: str, temperature: float = 0.3,
+                    max_tokens: int = 1000, use_cache: Optional[bool] = None,
+                    system_prefix: Optional[str] = None) -> Iterator[str]:
+        """Yield the completion as it is generated, for callers that render or parse incrementally
+        Same caching as generate_code (a cache hit is yielded in one piece); token usage is read from
+        the final chunk into last_usage once the stream is exhausted"""
         self.current_model = model
+        cache_path, cached = self._cached(system_prompt, user_prompt, model, temperature, max_tokens, use_cache)
+        if cached is not None:
+            yield cached
+            return
         
+        parts = []
+        self.last_usage = None
         try:
-            response = self.client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=temperature,
-                max_tokens=max_tokens
-            )
-            code = response.choices[0].message.content.strip()
-            
-            # Track token usage for cost estimation
-            if hasattr(response, 'usage'):
-                self.last_usage = {
-                    'prompt_tokens': response.usage.prompt_tokens,
-                    'completion_tokens': response.usage.completion_tokens,
-                    'total_tokens': response.usage.total_tokens
-                }
-            else:
-                self.last_usage = None
-            
+            tokens = estimate_tokens(model, system_prompt + user_prompt, max_tokens)
+            with limiter_for(model).reserve(tokens):
+                stream = self.client.chat.completions.create(
+                    model=model,
+                    messages=self._build_messages(system_prompt, user_prompt, model, system_prefix),
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    stream=True,
+                    extra_body={"stream_options": {"include_usage": True}}
+                )
+                for chunk in stream:
+                    usage = getattr(chunk, 'usage', None)
+                    if usage:
+                        self.last_usage = {
+                            'prompt_tokens': usage.prompt_tokens,
+                            'completion_tokens': usage.completion_tokens,
+                            'total_tokens': usage.total_tokens
+                        }
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        delta = chunk.choices[0].delta.content
+                        parts.append(delta)
+                        yield delta
+        except Exception as e:
+            raise Exception(f"Error generating code with {model}: {str(e)}")
+        
+        if cache_path is not None:
+            self._write_cache(cache_path, ''.join(parts).strip())
+    
+    async def agenerate_code(self, system_prompt: str, user_prompt: str,
+                             model: str, temperature: float = 0.3,
+                             max_tokens: int = 1000, use_cache: Optional[bool] = None,
+                             system_prefix: Optional[str] = None, dedupe: Optional[bool] = None) -> str:
+        """Generate code without blocking (run on llm_providers.event_loop); same caching as generate_code
+        Concurrent identical requests share one API call when dedupe is True, or by default at
+        temperature 0 (sampled requests are left alone, e.g. candidates meant to differ)"""
+        self.current_model = model
+        cache_path, cached = self._cached(system_prompt, user_prompt, model, temperature, max_tokens, use_cache)
+        if cached is not None:
+            return cached
+        
+        if dedupe is None:
+            dedupe = temperature == 0
+        call = self._agenerate(system_prompt, user_prompt, model, temperature, max_tokens, system_prefix, cache_path)
+        if not dedupe:
+            return await call
+        
+        key = self._request_key(system_prompt, user_prompt, model, temperature, max_tokens)
+        task = self._inflight.get(key)
+        if task is None:
+            task = self._inflight[key] = asyncio.ensure_future(call)
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            call.close()
+        # Shielded so one caller giving up doesn't cancel the call the others are waiting on
+        return await asyncio.shield(task)
+    
+    async def _agenerate(self, system_prompt: str, user_prompt: str, model: str, temperature: float,
+                         max_tokens: int, system_prefix: Optional[str], cache_path: Optional[str]) -> str:
+        try:
+            tokens = estimate_tokens(model, system_prompt + user_prompt, max_tokens)
+            async with limiter_for(model).reserve(tokens):
+                response = await self.aclient.chat.completions.create(
+                    model=model,
+                    messages=self._build_messages(system_prompt, user_prompt, model, system_prefix),
+                    temperature=temperature,
+                    max_tokens=max_tokens
+                )
+            code = self._read_response(response)
+            if cache_path is not None:
+                self._write_cache(cache_path, code)
             return code
         except Exception as e:
             raise Exception(f"Error generating code with {model}: {str(e)}")
     
+    async def generate_code_many(self, requests: List[Dict], max_concurrent: int = 8) -> List:
+        """Run several generate_code requests (dicts of its keyword arguments) concurrently,
+        at most max_concurrent in flight; results keep the order of requests, and a failed
+        request yields its exception instead of the code"""
+        semaphore = asyncio.Semaphore(max_concurrent)
+        
+        async def one(request):
+            async with semaphore:
+                return await self.agenerate_code(**request)
+        
+        return await asyncio.gather(*[one(request) for request in requests], return_exceptions=True)
+    
+    def run_batch(self, requests: List[Dict], max_concurrent: int = 8) -> List:
+        """Blocking wrapper around generate_code_many for scripts and evaluation sweeps"""
+        return run_coroutine(self.generate_code_many(requests, max_concurrent=max_concurrent))
+    
+    def _parse_batch_answers(self, content: str, count: int) -> Optional[List[str]]:
+        """Answers from a batched completion, or None unless it is a JSON list of count strings"""
+        content = content.strip()
+        if content.startswith('```'):
+            content = content.strip('`').removeprefix('json').strip()
+        try:
+            answers = json.loads(content).get('answers')
+        except (ValueError, AttributeError):
+            return None
+        if not isinstance(answers, list) or len(answers) != count or not all(isinstance(a, str) for a in answers):
+            return None
+        return [a.strip() for a in answers]
+    
+    def _generate_batch_chunk(self, system_prompt: str, user_prompts: List[str], model: str,
+                              temperature: float, max_tokens_per_item: int) -> List[str]:
+        if len(user_prompts) == 1:
+            code = self.generate_code(system_prompt, user_prompts[0], model=model,
+                                      temperature=temperature, max_tokens=max_tokens_per_item)
+            self.last_batch_usage = [self.last_usage]
+            return [code]
+        
+        batch_system_prompt = system_prompt + _BATCH_INSTRUCTIONS
+        batch_user_prompt = "Answer each question, return JSON list.\n" + "\n".join(
+            f"{i}) {prompt}" for i, prompt in enumerate(user_prompts, 1))
+        max_tokens = max_tokens_per_item * len(user_prompts)
+        answers = None
+        try:
+            tokens = estimate_tokens(model, batch_system_prompt + batch_user_prompt, max_tokens)
+            with limiter_for(model).reserve(tokens):
+                response = self.client.chat.completions.create(
+                    model=model,
+                    messages=self._build_messages(batch_system_prompt, batch_user_prompt),
+                    temperature=temperature,
+                    max_tokens=max_tokens
+                )
+            answers = self._parse_batch_answers(self._read_response(response), len(user_prompts))
+        except Exception as e:
+            print(f"Warning: batched request with {model} failed ({e}), asking one by one")
+        
+        if answers is None:
+            # Unparseable or failed batch: fall back to one request per question
+            answers, usages = [], []
+            for prompt in user_prompts:
+                answers.append(self.generate_code(system_prompt, prompt, model=model,
+                                                  temperature=temperature, max_tokens=max_tokens_per_item))
+                usages.append(self.last_usage)
+            self.last_batch_usage = usages
+            return answers
+        
+        # Attribute the shared call's tokens to each question by the length of its answer
+        usage = self.last_usage or {}
+        total_chars = sum(len(a) for a in answers) or 1
+        self.last_batch_usage = []
+        for answer in answers:
+            share = len(answer) / total_chars
+            prompt_tokens = usage.get('prompt_tokens', 0) / len(answers)
+            completion_tokens = usage.get('completion_tokens', 0) * share
+            self.last_batch_usage.append({
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': completion_tokens,
+                'total_tokens': prompt_tokens + completion_tokens
+            })
+        return answers
+    
+    def generate_code_batch(self, system_prompt: str, user_prompts: List[str], model: str,
+                            temperature: float = 0.3, max_tokens_per_item: int = 1000,
+                            batch_size: int = 10) -> List[str]:
+        """Generate code for many questions with one completion per batch_size questions
+        (for offline evaluation); batches the model answers malformed are retried one question at a time.
+        Estimated per-question token usage is left in last_batch_usage"""
+        self.current_model = model
+        results, usages = [], []
+        for start in range(0, len(user_prompts), batch_size):
+            results.extend(self._generate_batch_chunk(system_prompt, user_prompts[start:start + batch_size],
+                                                      model, temperature, max_tokens_per_item))
+            usages.extend(self.last_batch_usage)
+        self.last_batch_usage = usages
+        return results
+    
+    def close(self):
+        """Close the pooled HTTP connections"""
+        self._http.close()
+        # The async pool lives on the shared event loop, so it is closed there
+        run_coroutine(self._ahttp.aclose())
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+    
     def get_model_name(self) -> str:
         """Get current model name"""
         return self.current_model or "unknown"
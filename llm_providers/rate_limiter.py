@@ -0,0 +1,159 @@
+"""
+Rate limiting for LLM API calls
+Per-model request and token budgets (token buckets refilled continuously) plus a cap on requests in flight,
+so concurrent sessions queue locally instead of collecting 429s from the provider
+"""
+import asyncio
+import threading
+import time
+from functools import lru_cache
+from typing import Dict, Optional
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Requests/tokens per minute and concurrent requests per model (OpenAI tier 1 / OpenRouter defaults);
+# tokens_per_minute=None leaves token usage unlimited
+DEFAULT_LIMITS = {
+    "gpt-4": {"requests_per_minute": 500, "tokens_per_minute": 10000, "max_concurrent": 16},
+}
+FALLBACK_LIMITS = {"requests_per_minute": 200, "tokens_per_minute": None, "max_concurrent": 8}
+
+@lru_cache(maxsize=None)
+def _encoding(model: str):
+    """tiktoken encoding for a model id, resolved once per model
+    OpenRouter ids such as openai/gpt-4 map to the upstream name"""
+    try:
+        return tiktoken.encoding_for_model(model.rsplit('/', 1)[-1])
+    except KeyError:
+        # Non-OpenAI models: cl100k_base counts are close enough for budgeting
+        return tiktoken.get_encoding('cl100k_base')
+
+def estimate_tokens(model: str, text: str, max_tokens: int = 0) -> int:
+    """Tokens a request may use: the prompt (counted with tiktoken when installed, else ~4 chars
+    per token) plus the completion budget"""
+    if tiktoken is not None:
+        prompt_tokens = len(_encoding(model).encode(text, disallowed_special=()))
+    else:
+        prompt_tokens = len(text) // 4 + 1
+    return prompt_tokens + max_tokens
+
+class _Reservation:
+    """Context manager that takes one request and `tokens` tokens from a RateLimiter"""
+    __slots__ = ('limiter', 'tokens')
+
+    def __init__(self, limiter: 'RateLimiter', tokens: int):
+        self.limiter = limiter
+        self.tokens = tokens
+
+    async def __aenter__(self):
+        await self.limiter.acquire(self.tokens)
+        return self.limiter
+
+    async def __aexit__(self, *exc):
+        self.limiter.release()
+
+    def __enter__(self):
+        self.limiter.acquire_sync(self.tokens)
+        return self.limiter
+
+    def __exit__(self, *exc):
+        self.limiter.release_sync()
+
+class RateLimiter:
+    """Requests- and tokens-per-minute token buckets and a concurrency cap for one model
+    Use `async with limiter.reserve(tokens):` on the LLM event loop or `with limiter.reserve(tokens):`
+    from sync code (`async with limiter:` / `with limiter:` reserve a request without tokens)"""
+
+    def __init__(self, requests_per_minute: int = 200, max_concurrent: int = 8,
+                 tokens_per_minute: Optional[int] = None):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_concurrent = max_concurrent
+        self._lock = threading.Lock()
+        self._available = float(requests_per_minute)
+        self._tokens_available = float(tokens_per_minute or 0)
+        self._updated = time.monotonic()
+        self._sync_slots = threading.BoundedSemaphore(max_concurrent)
+        # asyncio.Semaphore binds to the running loop, so it is created on first async use
+        self._async_slots = None
+
+    def _reserve(self, tokens: int = 0) -> float:
+        """Take one request and `tokens` tokens from the buckets; return how long to wait before sending"""
+        with self._lock:
+            now = time.monotonic()
+            elapsed = now - self._updated
+            self._updated = now
+            rate = self.requests_per_minute / 60.0
+            self._available = min(self.requests_per_minute, self._available + elapsed * rate)
+            self._available -= 1
+            wait = 0.0 if self._available >= 0 else -self._available / rate
+            if self.tokens_per_minute:
+                token_rate = self.tokens_per_minute / 60.0
+                self._tokens_available = min(self.tokens_per_minute, self._tokens_available + elapsed * token_rate)
+                # A request larger than the whole budget waits for a full bucket, not forever
+                self._tokens_available -= min(tokens, self.tokens_per_minute)
+                if self._tokens_available < 0:
+                    wait = max(wait, -self._tokens_available / token_rate)
+            return wait
+
+    def reserve(self, tokens: int = 0) -> _Reservation:
+        return _Reservation(self, tokens)
+
+    async def acquire(self, tokens: int = 0):
+        if self._async_slots is None:
+            self._async_slots = asyncio.Semaphore(self.max_concurrent)
+        await self._async_slots.acquire()
+        wait = self._reserve(tokens)
+        if wait > 0:
+            try:
+                await asyncio.sleep(wait)
+            except BaseException:
+                # Cancelled while waiting: __aexit__ won't run, so give the slot back here
+                self._async_slots.release()
+                raise
+
+    def release(self):
+        self._async_slots.release()
+
+    def acquire_sync(self, tokens: int = 0):
+        self._sync_slots.acquire()
+        wait = self._reserve(tokens)
+        if wait > 0:
+            try:
+                time.sleep(wait)
+            except BaseException:
+                self._sync_slots.release()
+                raise
+
+    def release_sync(self):
+        self._sync_slots.release()
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc):
+        self.release()
+
+    def __enter__(self):
+        self.acquire_sync()
+        return self
+
+    def __exit__(self, *exc):
+        self.release_sync()
+
+_limiters: Dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+def limiter_for(model: str) -> RateLimiter:
+    """Shared RateLimiter for a model id"""
+    limiter = _limiters.get(model)
+    if limiter is None:
+        with _limiters_lock:
+            limiter = _limiters.get(model)
+            if limiter is None:
+                limiter = _limiters[model] = RateLimiter(**DEFAULT_LIMITS.get(model, FALLBACK_LIMITS))
+    return limiter
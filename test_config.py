@@ -0,0 +1,55 @@
+"""
+Tests for the .env parser in config.py
+Run: python -m unittest test_config
+"""
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+import config
+
+
+def parse_env(text, newline='\n'):
+    """Write text to a temporary .env file and parse it"""
+    with tempfile.NamedTemporaryFile('w', suffix='.env', delete=False, encoding='utf-8', newline=newline) as f:
+        f.write(text)
+    try:
+        return dict(config._load_env_once(f.name, os.path.getmtime(f.name)))
+    finally:
+        os.remove(f.name)
+
+
+class EnvParserTest(unittest.TestCase):
+    def test_crlf_line_endings(self):
+        # setup_env.bat writes .env with CRLF line endings
+        env = parse_env('OPENAI_API_KEY=sk-abc\nSECRET_KEY="s3"\n', newline='\r\n')
+        self.assertEqual(env, {'OPENAI_API_KEY': 'sk-abc', 'SECRET_KEY': 's3'})
+
+    def test_lf_line_endings(self):
+        env = parse_env('OPENAI_API_KEY=sk-abc\n\nSECRET_KEY="s3"\n')
+        self.assertEqual(env, {'OPENAI_API_KEY': 'sk-abc', 'SECRET_KEY': 's3'})
+
+    def test_export_prefix(self):
+        self.assertEqual(parse_env('export OPENAI_MODEL=gpt-4o\n'), {'OPENAI_MODEL': 'gpt-4o'})
+
+    def test_single_and_double_quotes(self):
+        env = parse_env("SECRET_KEY='a b'\nOPENAI_MODEL=\"gpt-4\"\n")
+        self.assertEqual(env, {'SECRET_KEY': 'a b', 'OPENAI_MODEL': 'gpt-4'})
+
+    def test_unquoted_value_is_stripped(self):
+        self.assertEqual(parse_env('OPENAI_MODEL =  gpt-4  \nEMPTY=\n'), {'OPENAI_MODEL': 'gpt-4', 'EMPTY': ''})
+
+    def test_inline_comment_is_kept(self):
+        # Unlike python-dotenv, text after an unquoted value is not treated as a comment
+        self.assertEqual(parse_env('OPENAI_MODEL=gpt-4 # default\n'), {'OPENAI_MODEL': 'gpt-4 # default'})
+
+    def test_comment_lines_are_skipped(self):
+        self.assertEqual(parse_env('# OPENAI_MODEL=gpt-4\nSECRET_KEY=s3\n'), {'SECRET_KEY': 's3'})
+
+    def test_env_file_is_next_to_config(self):
+        self.assertEqual(config._ENV_FILE, Path(config.__file__).parent / '.env')
+
+
+if __name__ == '__main__':
+    unittest.main()
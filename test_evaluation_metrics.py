@@ -0,0 +1,117 @@
+"""
+Regression tests for evaluation_metrics.py
+Run: python -m unittest test_evaluation_metrics
+"""
+import contextlib
+import io
+import unittest
+
+import evaluation_metrics as em
+
+
+def quiet(func, *args, **kwargs):
+    """Call a metric function without its progress prints"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return func(*args, **kwargs)
+
+
+class PromptUnderstandingTest(unittest.TestCase):
+    def test_sort_values_ascending_counts_as_bottom_n(self):
+        result = quiet(em.analyze_prompt_understanding,
+                       'show the bottom 3 items by price',
+                       "result = df.sort_values('price', ascending=True)[:3]")
+        self.assertAlmostEqual(result['details']['nl_parsing_score'], 0.06)
+
+    def test_sort_values_descending_counts_as_top_n(self):
+        result = quiet(em.analyze_prompt_understanding,
+                       'show the top 3 items by price',
+                       "result = df.sort_values('price', ascending=False)[:3]")
+        self.assertAlmostEqual(result['details']['nl_parsing_score'], 0.06)
+
+
+class TimeComplexityTest(unittest.TestCase):
+    """Loop counts must match the regex-based counting the AST walk replaced"""
+
+    def assert_loops(self, code, nested_loops, notation):
+        result = em.analyze_time_complexity(code)
+        self.assertEqual(result['nested_loops'], nested_loops)
+        self.assertEqual(result['notation'], notation)
+
+    def test_iterrows_loop_is_one_loop(self):
+        self.assert_loops("for i, row in df.iterrows():\n    total += row['price']", 1, 'O(n)')
+
+    def test_plain_for_loop(self):
+        self.assert_loops("for x in items:\n    print(x)", 1, 'O(n)')
+
+    def test_nested_for_loops(self):
+        self.assert_loops("for a in xs:\n    for b in ys:\n        pass", 2, 'O(n²)')
+
+    def test_apply_call(self):
+        self.assert_loops("result = df['a'].apply(lambda v: v * 2)", 1, 'O(n)')
+
+    def test_while_loop(self):
+        self.assert_loops("while n > 0:\n    n -= 1", 1, 'O(n)')
+
+    def test_comprehension(self):
+        self.assert_loops("result = [x for x in values]", 1, 'O(n)')
+
+    def test_no_loops(self):
+        self.assert_loops("result = df.sort_values('price').head(3)", 0, 'O(n log n)')
+
+    # Quirks of the text patterns that stored scores depend on
+
+    def test_loop_in_comment_counts(self):
+        self.assert_loops("# for x in y\nresult = df.sort_values('a')", 1, 'O(n log n)')
+
+    def test_loop_in_string_counts(self):
+        self.assert_loops("msg = 'for x in items:'\nresult = 1", 1, 'O(n)')
+
+    def test_tuple_target_loop_is_not_counted(self):
+        self.assert_loops("for a, b in zip(xs, ys):\n    pass", 0, 'O(1)')
+
+    def test_tuple_target_dict_comprehension_is_not_counted(self):
+        self.assert_loops("d2 = {k: v for k, v in d.items()}", 0, 'O(1)')
+
+    def test_loop_over_apply_counts_twice(self):
+        self.assert_loops("for x in s.apply(f):\n    pass", 2, 'O(n²)')
+
+    def test_loop_over_itertuples_counts_twice(self):
+        self.assert_loops("for row in df.itertuples():\n    print(row)", 2, 'O(n²)')
+
+
+class CodeQualityTest(unittest.TestCase):
+    """Import and comment detection must match the regex-based checks"""
+
+    def test_indented_import_is_not_counted(self):
+        self.assertFalse(em.check_code_quality("def f():\n    import math\n    return 1")['has_imports'])
+
+    def test_top_level_import(self):
+        self.assertTrue(em.check_code_quality("import pandas as pd\nresult = 1")['has_imports'])
+
+    def test_hash_in_string_counts_as_comment(self):
+        self.assertTrue(em.check_code_quality("s = 'a#b'\nresult = 1")['has_comments'])
+
+
+class ColumnExtractionTest(unittest.TestCase):
+    """Column extraction must match the regex-based extraction the AST walk replaced"""
+
+    def extracted(self, code):
+        result = quiet(em.analyze_prompt_understanding, 'total price', code)
+        return sorted(result['details']['extracted_columns'])
+
+    def test_derived_dataframe_names(self):
+        code = "filtered_df = df[df['region'] == 'west']\nresult = filtered_df['price'].sum()"
+        self.assertEqual(self.extracted(code), ['price', 'region'])
+
+    def test_column_list(self):
+        self.assertEqual(self.extracted("result = df[['price', 'qty']].mean()"), ['price', 'qty'])
+
+    def test_attribute_dataframe(self):
+        self.assertEqual(self.extracted('result = self.df["Price"].max()'), ['price'])
+
+    def test_pandas_method_names_are_not_columns(self):
+        self.assertEqual(self.extracted("result = df['count'].sum()"), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
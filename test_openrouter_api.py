@@ -1,12 +1,14 @@
 """
 Test script to verify OpenRouter API key
 """
+import json
 import os
-import requests
-from dotenv import load_dotenv
+import time
+import httpx
+from config import load_env_file
 
 # Load environment variables
-load_dotenv()
+load_env_file()
 
 API_KEY = os.getenv('OPENROUTER_API_KEY')
 
@@ -25,6 +27,9 @@ print()
 
 url = "https://openrouter.ai/api/v1/chat/completions"
 
+# One pooled keep-alive client for every request the script makes
+http = httpx.Client(timeout=30, limits=httpx.Limits(max_keepalive_connections=20))
+
 headers = {
     "Authorization": f"Bearer {API_KEY}",
     "HTTP-Referer": "https://github.com/yourusername/ise547project",
@@ -36,35 +41,49 @@ payload = {
     "model": "openai/gpt-4",
     "messages": [
         {"role": "user", "content": "Say hello"}
-    ]
+    ],
+    # Stream the reply as server-sent events, the same contract OpenRouterProvider.stream_code uses
+    "stream": True
 }
 
 try:
-    response = requests.post(url, headers=headers, json=payload, timeout=30)
-    
-    print(f"Status Code: {response.status_code}")
-    print(f"Response Headers: {dict(response.headers)}")
-    print()
-    
-    if response.status_code == 200:
-        print("✅ SUCCESS! API key is valid")
-        result = response.json()
-        print(f"Response: {result.get('choices', [{}])[0].get('message', {}).get('content', 'No content')}")
-    else:
-        print(f"❌ ERROR: {response.status_code}")
-        print(f"Response: {response.text}")
+    start = time.perf_counter()
+    with http.stream("POST", url, headers=headers, json=payload) as response:
+        print(f"Status Code: {response.status_code}")
+        print()
         
-        if response.status_code == 401:
-            print()
-            print("Possible issues:")
-            print("1. API key is invalid or expired")
-            print("2. API key format is incorrect")
-            print("3. Account not found or not activated")
-            print("4. Check your OpenRouter account at https://openrouter.ai/keys")
+        if response.status_code == 200:
+            print("✅ SUCCESS! API key is valid")
+            parts = []
+            for line in response.iter_lines():
+                # SSE: "data: {chunk}" lines, ": keep-alive" comments, and a final "data: [DONE]"
+                if not line.startswith("data: ") or line == "data: [DONE]":
+                    continue
+                choices = json.loads(line[len("data: "):]).get('choices') or [{}]
+                delta = choices[0].get('delta', {}).get('content')
+                if delta:
+                    if not parts:
+                        print(f"Time to first token: {(time.perf_counter() - start) * 1000:.0f} ms")
+                    parts.append(delta)
+            print(f"Response: {''.join(parts) or 'No content'}")
+            print(f"Total time: {(time.perf_counter() - start) * 1000:.0f} ms")
+        else:
+            print(f"❌ ERROR: {response.status_code}")
+            print(f"Response: {response.read().decode('utf-8', 'replace')}")
+            
+            if response.status_code == 401:
+                print()
+                print("Possible issues:")
+                print("1. API key is invalid or expired")
+                print("2. API key format is incorrect")
+                print("3. Account not found or not activated")
+                print("4. Check your OpenRouter account at https://openrouter.ai/keys")
             
-except requests.exceptions.RequestException as e:
+except httpx.HTTPError as e:
     print(f"❌ Network Error: {e}")
     print("Please check your internet connection")
+finally:
+    http.close()
 
 
 